@@ -0,0 +1,248 @@
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from data_loader import contiguous
+
+
+@dataclass
+class DashboardAggregates:
+    # Everything the dashboard charts read, computed from one set of filtered rows. Fields of
+    # dashboard sections that were not computed are None.
+    total_revenue: Optional[float] = None
+    total_orders: Optional[int] = None
+    total_customers: Optional[int] = None
+    sales_over_time: Optional[pd.DataFrame] = None
+    sales_by_category: Optional[pd.DataFrame] = None
+    sales_by_subcategory: Optional[pd.DataFrame] = None
+    top_products: Optional[pd.DataFrame] = None
+    sales_by_day: Optional[pd.DataFrame] = None
+    age_group_counts: Optional[pd.DataFrame] = None
+    gender_counts: Optional[pd.DataFrame] = None
+    payment_counts: Optional[pd.DataFrame] = None
+    sales_by_country: Optional[pd.DataFrame] = None
+
+
+# Fields of DashboardAggregates each dashboard section shows
+SECTION_FIELDS = {
+    'metrics': ['total_revenue', 'total_orders', 'total_customers'],
+    'sales_over_time': ['sales_over_time'],
+    'sales_by_category': ['sales_by_category', 'sales_by_subcategory'],
+    'top_products': ['top_products'],
+    'sales_by_day': ['sales_by_day'],
+    'demographics': ['age_group_counts', 'gender_counts'],
+    'payment_methods': ['payment_counts'],
+    'sales_by_country': ['sales_by_country'],
+}
+SECTIONS = list(SECTION_FIELDS)
+
+# Chart columns counted per category for each section (metrics and sales_over_time need none)
+SECTION_TOTALS = {
+    'sales_by_category': ['category', 'subcategory'],
+    'top_products': ['product_name'],
+    'sales_by_day': ['day_of_week'],
+    'demographics': ['age_group', 'gender'],
+    'payment_methods': ['payment_method'],
+    'sales_by_country': ['country'],
+}
+
+
+def code_totals(series, rows=None, **weights):
+    # Row count and weighted sums per category of a categorical column, via np.bincount
+    # on its integer codes (shifted by one so missing values land in a dropped bin).
+    # rows holds the number of orders behind each row when series comes from cube cells.
+    codes = series.cat.codes.to_numpy().astype(np.intp) + 1
+    size = len(series.cat.categories) + 1
+    counts = np.bincount(codes, weights=rows, minlength=size)[1:]
+    totals = {'count': counts if rows is None else counts.astype(np.int64)}
+    for name, values in weights.items():
+        totals[name] = np.bincount(codes, weights=values, minlength=size)[1:]
+    return totals
+
+
+def observed_sums(name, categories, totals, columns=('total_amount',)):
+    # Same shape as groupby(col, observed=True).agg(sum).reset_index()
+    present = totals['count'] > 0
+    result = pd.DataFrame({name: categories[present]})
+    for column in columns:
+        result[column] = totals[column][present]
+    return result
+
+
+def category_counts(name, categories, totals):
+    return pd.DataFrame({name: categories, 'count': totals['count']})
+
+
+def day_numbers(dates):
+    return dates.to_numpy().astype('datetime64[D]').view(np.int64)
+
+
+def sales_by_day_number(first, counts, sums):
+    # Sum of amount per calendar day from per-day totals starting at day number first,
+    # only for days that have orders
+    present = np.flatnonzero(counts)
+    return pd.DataFrame({
+        'order_date': pd.to_datetime((present + first).astype('datetime64[D]')),
+        'total_amount': sums[present],
+    })
+
+
+def daily_sales(dates, amount):
+    days = day_numbers(dates)
+    first = days.min()
+    return sales_by_day_number(first, np.bincount(days - first), np.bincount(days - first, weights=amount))
+
+
+def value_counts(name, categories, totals):
+    # value_counts order (most frequent first), categories with no rows left out
+    counts = category_counts(name, categories, totals)
+    counts = counts[counts['count'] > 0].sort_values('count', ascending=False, kind='stable')
+    return counts.reset_index(drop=True)
+
+
+# Chart frames built from the code_totals of one column: field, column and builder
+CHART_FRAMES = [
+    ('sales_by_category', 'category', observed_sums),
+    ('sales_by_subcategory', 'subcategory', observed_sums),
+    ('sales_by_day', 'day_of_week', observed_sums),
+    ('age_group_counts', 'age_group', category_counts),
+    ('gender_counts', 'gender', value_counts),
+    ('payment_counts', 'payment_method', value_counts),
+    ('sales_by_country', 'country', observed_sums),
+]
+
+
+def build_aggregates(categories, totals, total_revenue=None, sales_over_time=None, distinct_counts=(None, None),
+                     top_n=10):
+    # The bundle from code_totals of the chart columns in totals (categories holds each column's
+    # categories); charts whose column is not in totals are left None
+    fields = {'total_revenue': total_revenue, 'total_orders': distinct_counts[0],
+              'total_customers': distinct_counts[1], 'sales_over_time': sales_over_time}
+    if 'product_name' in totals:
+        top_products = observed_sums('product_name', categories['product_name'], totals['product_name'],
+                                     ('quantity', 'total_amount'))
+        top_products['quantity'] = top_products['quantity'].astype(np.int64)
+        fields['top_products'] = top_products.sort_values(by='total_amount', ascending=False).head(top_n)
+    for field, col, build in CHART_FRAMES:
+        if col in totals:
+            fields[field] = build(col, categories[col], totals[col])
+    return DashboardAggregates(**fields)
+
+
+def totals_columns(sections):
+    return [col for section in sections for col in SECTION_TOTALS.get(section, [])]
+
+
+# Chart columns summed over total_amount, and chart columns that are only counted
+SUM_COLUMNS = ['category', 'subcategory', 'day_of_week', 'country']
+COUNT_COLUMNS = ['age_group', 'gender', 'payment_method']
+
+
+def compute_aggregates(frame, products=None, keys=None, distinct_counts=None, top_n=10, sections=SECTIONS):
+    # frame holds either filtered order rows or filtered cube cells (with a 'rows' column).
+    # products and keys default to frame and supply Top 10 Products and the distinct counts,
+    # unless (orders, customers) distinct_counts are given, e.g. estimated from sketches.
+    # Only the fields of the given dashboard sections are computed.
+    products = frame if products is None else products
+    keys = frame if keys is None else keys
+    amount = frame['total_amount'].to_numpy()
+    rows = frame['rows'].to_numpy() if 'rows' in frame else None
+
+    totals = {}
+    categories = {}
+    for col in totals_columns(sections):
+        if col == 'product_name':
+            totals[col] = code_totals(
+                products[col], products['rows'].to_numpy() if 'rows' in products else None,
+                total_amount=products['total_amount'].to_numpy(), quantity=products['quantity'].to_numpy())
+            categories[col] = products[col].cat.categories
+        else:
+            weights = {'total_amount': amount} if col in SUM_COLUMNS else {}
+            totals[col] = code_totals(frame[col], rows, **weights)
+            categories[col] = frame[col].cat.categories
+
+    total_revenue = None
+    if 'metrics' in sections:
+        total_revenue = amount.sum()
+        if distinct_counts is None:
+            distinct_counts = keys['order_id'].nunique(), keys['customer_id'].nunique()
+    sales_over_time = daily_sales(frame['order_date'], amount) if 'sales_over_time' in sections else None
+
+    return build_aggregates(categories, totals, total_revenue, sales_over_time,
+                            distinct_counts if 'metrics' in sections else (None, None), top_n)
+
+
+class FilteredTotals:
+    # Running totals of a set of order rows. Adding or removing rows costs time proportional to
+    # those rows, so a filter change that flips few rows is cheap. Distinct orders and customers
+    # are counted per surrogate key. Only the totals of the given dashboard sections are kept;
+    # with distinct_only just the distinct counts (the cubes answer the rest).
+    def __init__(self, orders, sections=SECTIONS, distinct_only=False):
+        self.orders = orders
+        self.distinct_only = distinct_only
+        self.sections = () if distinct_only else tuple(sections)
+        # Keys that are still UUID strings (no snapshot could be written) are numbered once here
+        self.key_codes = {}
+        self.key_counts = {}
+        if distinct_only or 'metrics' in self.sections:
+            for col in ['order_id', 'customer_id']:
+                keys = orders[col]
+                if not pd.api.types.is_integer_dtype(keys):
+                    keys = self.key_codes[col] = pd.factorize(keys)[0]
+                self.key_counts[col] = np.zeros(int(keys.max()) + 1 if len(keys) else 0, dtype=np.int64)
+        self.categories = {col: orders[col].cat.categories for col in totals_columns(self.sections)}
+        self.totals = {col: {'count': np.zeros(len(categories), dtype=np.int64)}
+                       for col, categories in self.categories.items()}
+        for col in self.totals:
+            if col in SUM_COLUMNS + ['product_name']:
+                self.totals[col]['total_amount'] = np.zeros(len(self.categories[col]))
+        if 'product_name' in self.totals:
+            self.totals['product_name']['quantity'] = np.zeros(len(self.categories['product_name']))
+        self.day_counts = None
+        if 'sales_over_time' in self.sections:
+            days = day_numbers(orders['order_date'].iloc[[0, -1]]) if len(orders) else np.zeros(2, dtype=np.int64)
+            self.first_day = days[0]
+            self.day_counts = np.zeros(days[1] - days[0] + 1, dtype=np.int64)
+            self.day_sums = np.zeros(days[1] - days[0] + 1)
+        self.total_revenue = 0.0
+
+    def covers(self, sections):
+        return set(sections) <= set(self.sections)
+
+    def update(self, rows, sign=1):
+        # Add (sign=1) or remove (sign=-1) the orders at positions rows. Each column is gathered
+        # through the selection on its own, so no filtered frame is ever materialized.
+        if not len(rows):
+            return
+        rows = contiguous(rows)
+        for col, counts in self.key_counts.items():
+            keys = self.key_codes[col][rows] if col in self.key_codes else self.orders.column(col, rows).to_numpy()
+            counts += sign * np.bincount(keys, minlength=len(counts))
+        if not self.sections:
+            return
+        amount = self.orders.column('total_amount', rows).to_numpy()
+        if 'metrics' in self.sections:
+            self.total_revenue += sign * amount.sum()
+        for col, totals in self.totals.items():
+            weights = {'total_amount': amount} if 'total_amount' in totals else {}
+            if col == 'product_name':
+                weights['quantity'] = self.orders.column('quantity', rows).to_numpy()
+            for name, values in code_totals(self.orders.column(col, rows), **weights).items():
+                totals[name] += sign * values
+        if self.day_counts is not None:
+            days = day_numbers(self.orders.column('order_date', rows)) - self.first_day
+            self.day_counts += sign * np.bincount(days, minlength=len(self.day_counts))
+            self.day_sums += sign * np.bincount(days, weights=amount, minlength=len(self.day_sums))
+
+    def distinct_counts(self):
+        return tuple(np.count_nonzero(self.key_counts[col]) for col in ['order_id', 'customer_id'])
+
+    def aggregates(self, top_n=10):
+        metrics = 'metrics' in self.sections
+        sales_over_time = None
+        if self.day_counts is not None:
+            sales_over_time = sales_by_day_number(self.first_day, self.day_counts, self.day_sums)
+        return build_aggregates(self.categories, self.totals, self.total_revenue if metrics else None,
+                                sales_over_time, self.distinct_counts() if metrics else (None, None), top_n)
@@ -1,9 +1,32 @@
 # app.py
 
+import os
+
 import streamlit as st
-import pandas as pd
-import numpy as np
-import plotly.express as px
+
+from charts import (age_group_figure, gender_figure, payment_methods_figure, sales_by_category_figure,
+                    sales_by_country_figure, sales_by_day_figure, sales_by_subcategory_figure, sales_over_time_figure,
+                    top_products_figure)
+from engine import (EXPORT_CACHE_MB, RESULT_CACHE_MB, DashboardEngine, EngineConfig, FilterSession,
+                    FilterSpec)
+from exports import ExportCache
+from profiling import StageHistory, StageTimer
+from result_cache import ResultCache
+
+# Share one read-only dataset across sessions instead of loading a copy for each session
+SHARED_DATASET = os.environ.get('DASHBOARD_SHARED_DATASET', '1') != '0'
+
+# Default of the sidebar toggle that estimates distinct orders/customers from the cube sketches
+APPROX_DISTINCT = os.environ.get('DASHBOARD_APPROX_DISTINCT', '0') == '1'
+
+# Show per-stage timings of every rerun in the sidebar (also turned on per session with ?profile=1)
+PROFILE = os.environ.get('DASHBOARD_PROFILE', '0') == '1'
+
+# Sections below the key metrics that start expanded; the others are only computed once opened
+OPEN_SECTIONS = os.environ.get('DASHBOARD_OPEN_SECTIONS', 'sales_over_time').split(',')
+
+# Loading, filtering and aggregation settings (DASHBOARD_USE_CUBE, DASHBOARD_PARTITIONED, ...)
+CONFIG = EngineConfig()
 
 # Set page configuration
 st.set_page_config(
@@ -13,47 +36,41 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
-# Load the data with preprocessing
-@st.cache_data
-def load_data():
-    # Load the dataset
-    df = pd.read_csv('synthetic_ecommerce_orders.csv')
-    
-    # Data Cleaning and Preprocessing
-    
-    # 1. Handle Missing Values
-    # Replace missing values with appropriate values or drop rows
-    df.replace('?', np.nan, inplace=True)
-    df.dropna(inplace=True)  # Alternatively, you can fill missing values
-    
-    # 2. Data Type Conversions
-    df['order_date'] = pd.to_datetime(df['order_date'])
-    numeric_columns = ['quantity', 'order_price', 'total_amount', 'age']
-    for col in numeric_columns:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-    
-    # 3. Remove Duplicates
-    df.drop_duplicates(inplace=True)
-    
-    # 4. Feature Engineering
-    # Extract date-related features
-    df['month'] = df['order_date'].dt.month
-    df['year'] = df['order_date'].dt.year
-    df['day_of_week'] = df['order_date'].dt.day_name()
-    df['hour'] = df['order_date'].dt.hour
-    
-    # Create age groups
-    df['age_group'] = pd.cut(df['age'], bins=[17, 24, 34, 44, 54, 64, np.inf],
-                             labels=['18-24', '25-34', '35-44', '45-54', '55-64', '65+'])
-    
-    # 5. Standardize Categorical Variables
-    categorical_columns = ['gender', 'payment_method', 'category', 'subcategory', 'product_name', 'country']
-    for col in categorical_columns:
-        df[col] = df[col].str.strip().str.title()
-    
-    return df
+# Aggregate bundles by filter state, shared by all sessions
+@st.cache_resource
+def load_result_cache():
+    return ResultCache(RESULT_CACHE_MB * 1024 * 1024)
+
+# CSV exports by filter state, shared by all sessions
+@st.cache_resource
+def load_export_cache():
+    return ExportCache(EXPORT_CACHE_MB * 1024 * 1024)
 
-df = load_data()
+# Single engine whose dataset (orders, filter index and cubes) is held in process memory and shared by
+# all sessions. Refreshes build the next version on a worker thread while sessions keep reading the
+# current one.
+@st.cache_resource
+def load_engine():
+    return DashboardEngine(CONFIG, load_result_cache(), load_export_cache())
+
+def session_engine():
+    # Engine of this session: the shared one, or one with its own copy of the orders
+    if SHARED_DATASET or CONFIG.incremental or CONFIG.partitioned:
+        return load_engine()
+    if 'engine' not in st.session_state:
+        st.session_state['engine'] = DashboardEngine(CONFIG, load_result_cache(), load_export_cache())
+    return st.session_state['engine']
+
+# Timing spans of this rerun, reported in the sidebar when profiling
+profiling = PROFILE or st.query_params.get('profile') == '1'
+timer = StageTimer(st.session_state.setdefault('stage_history', StageHistory()) if profiling else None)
+
+engine = session_engine()
+if not CONFIG.partitioned:
+    # Read the current version once, so the whole run sees one consistent dataset
+    with timer.span('load_data') as span:
+        view = engine.view()
+        span.rows = len(view.orders)
 
 # Dashboard title
 st.title('🛍️ E-commerce Sales Dashboard')
@@ -61,154 +78,187 @@ st.title('🛍️ E-commerce Sales Dashboard')
 # Sidebar filters
 st.sidebar.header('Filter Options')
 
+# Reload the CSV for every session, e.g. after the export was updated
+if st.sidebar.button('Refresh Data'):
+    # Sessions keep the current version until the refreshed one is swapped in; the partitioned
+    # store is read again on the next run
+    engine.refresh()
+    if CONFIG.partitioned:
+        st.rerun()
+
+if engine.refresher is not None:
+    status = f'Data version {view.number}'
+    if engine.refresher.refreshing:
+        status += ' (refreshing in the background)'
+    st.sidebar.caption(status)
+    if engine.refresher.error is not None:
+        st.sidebar.warning(f'Last refresh failed: {engine.refresher.error}')
+
+# HyperLogLog estimates avoid scanning the order and customer ids of the filtered rows
+approximate_counts = CONFIG.use_cube and st.sidebar.toggle('Approximate distinct counts', value=APPROX_DISTINCT)
+
 # Organize filters into expanders
 with st.sidebar.expander("Date Range", expanded=True):
-    # Date range filter
-    min_date = df['order_date'].min()
-    max_date = df['order_date'].max()
+    # Date range filter (orders are sorted by date)
+    if CONFIG.partitioned:
+        min_date, max_date = engine.date_bounds()
+    else:
+        min_date, max_date = view.min_date, view.max_date
     start_date = st.date_input('Start date', min_value=min_date, max_value=max_date, value=min_date)
     end_date = st.date_input('End date', min_value=min_date, max_value=max_date, value=max_date)
 
+if CONFIG.partitioned:
+    # Partitions outside the selected months are pruned before anything is read, so the filter
+    # options below only list values that occur in the selected months
+    with timer.span('load_months') as span:
+        view = engine.view(start_date, end_date)
+        span.rows = len(view.orders)
+filter_index = view.filter_index
+
 with st.sidebar.expander("Category Filters", expanded=True):
     # Category filter
-    categories = df['category'].unique()
+    categories = filter_index.values('category')
     selected_categories = st.multiselect('Select Categories', categories, default=categories)
     
     # Update subcategories based on selected categories
     if selected_categories:
-        filtered_subcategories = df[df['category'].isin(selected_categories)]['subcategory'].unique()
+        filtered_subcategories = filter_index.child_values('category', selected_categories, 'subcategory')
     else:
-        filtered_subcategories = df['subcategory'].unique()
+        filtered_subcategories = filter_index.values('subcategory')
     
     # Subcategory filter
     selected_subcategories = st.multiselect('Select Subcategories', filtered_subcategories, default=filtered_subcategories)
 
 with st.sidebar.expander("Customer Demographics", expanded=False):
     # Gender filter
-    genders = df['gender'].unique()
+    genders = filter_index.values('gender')
     selected_genders = st.multiselect('Select Genders', genders, default=genders)
     
     # Age group filter
-    age_groups = df['age_group'].unique()
+    age_groups = filter_index.values('age_group')
     selected_age_groups = st.multiselect('Select Age Groups', age_groups, default=age_groups)
 
 with st.sidebar.expander("Payment Methods", expanded=False):
     # Payment method filter
-    payment_methods = df['payment_method'].unique()
+    payment_methods = filter_index.values('payment_method')
     selected_payment_methods = st.multiselect('Select Payment Methods', payment_methods, default=payment_methods)
 
 
 # Apply filters
-mask = (
-    (df['order_date'] >= pd.to_datetime(start_date)) &
-    (df['order_date'] <= pd.to_datetime(end_date)) &
-    (df['category'].isin(selected_categories)) &
-    (df['subcategory'].isin(selected_subcategories)) &
-    (df['gender'].isin(selected_genders)) &
-    (df['age_group'].isin(selected_age_groups)) &
-    (df['payment_method'].isin(selected_payment_methods))
+spec = FilterSpec(
+    start_date=start_date,
+    end_date=end_date,
+    category=tuple(selected_categories),
+    subcategory=tuple(selected_subcategories),
+    gender=tuple(selected_genders),
+    age_group=tuple(selected_age_groups),
+    payment_method=tuple(selected_payment_methods),
 )
-filtered_data = df.loc[mask]
+
+def section_open(section):
+    # Whether a section's expander is open; toggling it reruns the script
+    return st.session_state.get(f'section_{section}', section in OPEN_SECTIONS)
+
+def section_expander(section, label):
+    return st.expander(label, expanded=section in OPEN_SECTIONS, key=f'section_{section}', on_change='rerun')
+
+# Only the key metrics and the open sections are aggregated. Each session keeps its own incremental
+# filter state, the aggregates of every section are cached per filter state for all sessions.
+open_sections = ['metrics'] + [section for section in ['sales_over_time', 'sales_by_category', 'top_products',
+                                                       'sales_by_day', 'demographics', 'payment_methods',
+                                                       'sales_by_country'] if section_open(section)]
+session = st.session_state.setdefault('filter_session', FilterSession())
+result = engine.aggregate(view, spec, session, approximate_counts, timer, open_sections)
+aggregates = result.aggregates
+
+# Last figure of every chart with the filter state it was built for
+figures = st.session_state.setdefault('figures', {})
+
+def show_chart(figure, data):
+    # Figure building (skipped while the filter state is unchanged) and serialization of one chart,
+    # timed as chart_<figure name>
+    name = figure.__name__.removesuffix('_figure')
+    with timer.span('chart_' + name, len(data)):
+        key, fig = figures.get(name, (None, None))
+        if key != result.key:
+            fig = figure(aggregates)
+            figures[name] = result.key, fig
+        st.plotly_chart(fig, width='stretch')
 
 # Check if filtered data is empty
-if filtered_data.empty:
+if aggregates is None:
     st.warning('No data matches the selected filters. Please adjust your filter selections.')
 else:
     # Display key metrics
     st.markdown("## 📊 Key Metrics")
-    total_revenue = filtered_data['total_amount'].sum()
-    total_orders = filtered_data['order_id'].nunique()
+    total_revenue = aggregates.total_revenue
+    total_orders = aggregates.total_orders
     aov = total_revenue / total_orders if total_orders > 0 else 0
-    total_customers = filtered_data['customer_id'].nunique()
+    total_customers = aggregates.total_customers
 
     col1, col2, col3, col4 = st.columns(4)
 
     col1.metric('Total Revenue', f'${total_revenue:,.2f}')
-    col2.metric('Total Orders', f'{total_orders}')
+    approx = '≈' if result.approximate else ''
+    col2.metric('Total Orders', f'{approx}{total_orders}')
     col3.metric('Average Order Value', f'${aov:,.2f}')
-    col4.metric('Total Customers', f'{total_customers}')
+    col4.metric('Total Customers', f'{approx}{total_customers}')
 
     # Sales Over Time
-    st.markdown("## 📈 Sales Over Time")
-    sales_over_time = filtered_data.groupby(filtered_data['order_date'].dt.to_period('D')).agg({'total_amount': 'sum'}).reset_index()
-    sales_over_time['order_date'] = sales_over_time['order_date'].dt.to_timestamp()
-    fig_sales_time = px.line(sales_over_time, x='order_date', y='total_amount', title='Total Sales Over Time',
-                             labels={'order_date': 'Order Date', 'total_amount': 'Total Sales ($)'})
-    st.plotly_chart(fig_sales_time, use_container_width=True)
+    with section_expander('sales_over_time', '📈 Sales Over Time'):
+        if 'sales_over_time' in open_sections:
+            show_chart(sales_over_time_figure, aggregates.sales_over_time)
 
     # Sales by Category and Subcategory
-    st.markdown("## 🛍️ Sales by Category and Subcategory")
-    sales_by_category = filtered_data.groupby('category').agg({'total_amount': 'sum'}).reset_index()
-    fig_sales_category = px.bar(sales_by_category, x='category', y='total_amount', title='Sales by Category',
-                                labels={'category': 'Category', 'total_amount': 'Total Sales ($)'})
-    st.plotly_chart(fig_sales_category, use_container_width=True)
-
-    sales_by_subcategory = filtered_data.groupby('subcategory').agg({'total_amount': 'sum'}).reset_index()
-    fig_sales_subcategory = px.bar(sales_by_subcategory, x='subcategory', y='total_amount', title='Sales by Subcategory',
-                                   labels={'subcategory': 'Subcategory', 'total_amount': 'Total Sales ($)'})
-    fig_sales_subcategory.update_layout(xaxis_tickangle=-45)
-    st.plotly_chart(fig_sales_subcategory, use_container_width=True)
+    with section_expander('sales_by_category', '🛍️ Sales by Category and Subcategory'):
+        if 'sales_by_category' in open_sections:
+            show_chart(sales_by_category_figure, aggregates.sales_by_category)
+            show_chart(sales_by_subcategory_figure, aggregates.sales_by_subcategory)
 
     # Top 10 Products
-    st.markdown("## 🏆 Top 10 Products")
-    top_products = filtered_data.groupby('product_name').agg({'quantity': 'sum', 'total_amount': 'sum'}).reset_index()
-    top_products = top_products.sort_values(by='total_amount', ascending=False).head(10)
-    fig_top_products = px.bar(top_products, x='product_name', y='total_amount', title='Top 10 Products by Sales',
-                              labels={'product_name': 'Product Name', 'total_amount': 'Total Sales ($)'})
-    fig_top_products.update_layout(xaxis_tickangle=-45)
-    st.plotly_chart(fig_top_products, use_container_width=True)
+    with section_expander('top_products', '🏆 Top 10 Products'):
+        if 'top_products' in open_sections:
+            show_chart(top_products_figure, aggregates.top_products)
 
     # Sales by Day of Week
-    st.markdown("## 📅 Sales by Day of Week")
-    sales_by_day = filtered_data.groupby('day_of_week').agg({'total_amount': 'sum'}).reset_index()
-    # Reorder days of the week
-    days_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    sales_by_day['day_of_week'] = pd.Categorical(sales_by_day['day_of_week'], categories=days_order, ordered=True)
-    sales_by_day = sales_by_day.sort_values('day_of_week')
-    fig_sales_day = px.bar(sales_by_day, x='day_of_week', y='total_amount', title='Sales by Day of Week',
-                           labels={'day_of_week': 'Day of Week', 'total_amount': 'Total Sales ($)'})
-    st.plotly_chart(fig_sales_day, use_container_width=True)
+    with section_expander('sales_by_day', '📅 Sales by Day of Week'):
+        if 'sales_by_day' in open_sections:
+            show_chart(sales_by_day_figure, aggregates.sales_by_day)
 
     # Customer Demographics
-    st.markdown("## 👥 Customer Demographics")
-
-    # Age Group Distribution
-    st.markdown("### Age Group Distribution")
-    age_group_counts = filtered_data['age_group'].value_counts().sort_index().reset_index()
-    age_group_counts.columns = ['age_group', 'count']
-    fig_age_group = px.bar(age_group_counts, x='age_group', y='count', title='Age Group Distribution',
-                           labels={'age_group': 'Age Group', 'count': 'Number of Customers'})
-    st.plotly_chart(fig_age_group, use_container_width=True)
-
-    # Gender Distribution
-    st.markdown("### Gender Distribution")
-    gender_counts = filtered_data['gender'].value_counts().reset_index()
-    gender_counts.columns = ['gender', 'count']
-    fig_gender = px.pie(gender_counts, names='gender', values='count', title='Gender Distribution')
-    st.plotly_chart(fig_gender, use_container_width=True)
+    with section_expander('demographics', '👥 Customer Demographics'):
+        if 'demographics' in open_sections:
+            # Age Group Distribution
+            st.markdown("### Age Group Distribution")
+            show_chart(age_group_figure, aggregates.age_group_counts)
+
+            # Gender Distribution
+            st.markdown("### Gender Distribution")
+            show_chart(gender_figure, aggregates.gender_counts)
 
     # Payment Methods Used
-    st.markdown("## 💳 Payment Methods Used")
-    payment_counts = filtered_data['payment_method'].value_counts().reset_index()
-    payment_counts.columns = ['payment_method', 'count']
-    fig_payment = px.pie(payment_counts, names='payment_method', values='count', title='Payment Methods')
-    st.plotly_chart(fig_payment, use_container_width=True)
+    with section_expander('payment_methods', '💳 Payment Methods Used'):
+        if 'payment_methods' in open_sections:
+            show_chart(payment_methods_figure, aggregates.payment_counts)
 
     # Geographic Distribution (if location data is available)
-    st.markdown("## 🌍 Sales by Country")
-    sales_by_country = filtered_data.groupby('country').agg({'total_amount': 'sum'}).reset_index()
-    fig_sales_country = px.choropleth(
-        sales_by_country,
-        locations='country',
-        locationmode='country names',
-        color='total_amount',
-        title='Sales by Country',
-        color_continuous_scale='Blues',
-        labels={'total_amount': 'Total Sales ($)'}
-    )
-    st.plotly_chart(fig_sales_country, use_container_width=True)
+    with section_expander('sales_by_country', '🌍 Sales by Country'):
+        if 'sales_by_country' in open_sections:
+            show_chart(sales_by_country_figure, aggregates.sales_by_country)
 
     # Download Filtered Data
     st.markdown("## 📥 Download Filtered Data")
-    csv = filtered_data.to_csv(index=False)
-    st.download_button(label='Download CSV', data=csv, file_name='filtered_data.csv', mime='text/csv')
+    # Runs only when the button is clicked, reading the columns the charts don't need from the snapshot.
+    # The file is written in chunks and reused while the filter state is unchanged.
+    def export_csv():
+        # An open handle keeps the file readable even if the export cache evicts it meanwhile
+        return open(engine.export_csv(view, spec, timer), 'rb')
+    st.download_button(label='Download CSV', data=export_csv, file_name='filtered_data.csv', mime='text/csv')
+
+if profiling:
+    # Latency, rows and traced allocations of each stage of this rerun, with percentiles over
+    # the last reruns of this session
+    timer.finish()
+    with st.sidebar.expander('Performance', expanded=True):
+        st.dataframe(timer.table(), hide_index=True, column_config={
+            col: st.column_config.NumberColumn(format='%.1f') for col in ['ms', 'Allocated KB', 'p50 ms', 'p95 ms']})
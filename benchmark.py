@@ -0,0 +1,295 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from aggregations import FilteredTotals, code_totals, compute_aggregates, daily_sales
+from charts import FIGURES
+from cube import CUBES, OrderCube
+from data_loader import SECTION_COLUMNS, current_snapshot, load_orders
+from engine import DASHBOARD_COLUMNS
+from exports import write_csv
+from filters import FILTER_DIMENSIONS, FilterIndex, date_range_slice
+from generate_orders import GeneratorConfig, write_orders
+
+BENCHMARK_DIR = Path('.benchmarks')
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+
+# A stage counts as a regression when it is this much slower than the baseline (and by more
+# than MIN_REGRESSION_SECONDS, so timer noise on sub-millisecond stages is ignored), or when its
+# peak resident memory or traced allocations grew by MEMORY_THRESHOLD (and by more than
+# MIN_REGRESSION_BYTES, below which page and allocator granularity dominate)
+REGRESSION_THRESHOLD = 0.2
+MIN_REGRESSION_SECONDS = 0.005
+MEMORY_THRESHOLD = 0.2
+MIN_REGRESSION_BYTES = 4 * 1024 * 1024
+
+
+def rss_bytes():
+    # Current resident set size on Linux, the peak so far elsewhere
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class RssSampler:
+    # Polls the resident set size on a thread while a stage runs, to catch its peak
+    def __init__(self, interval=0.002):
+        self.interval = interval
+
+    def __enter__(self):
+        self.start = self.peak = rss_bytes()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.poll, daemon=True)
+        self.thread.start()
+        return self
+
+    def poll(self):
+        while not self.done.wait(self.interval):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __exit__(self, *exc):
+        self.done.set()
+        self.thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+def measure(run, setup=None, repeat=3, allocations=True):
+    # Best and mean wall time over repeat runs, the peak resident memory reached during them and
+    # the peak of memory allocated through the Python allocator (NumPy arrays and Python objects,
+    # Arrow buffers are not traced) in one more run under tracemalloc
+    seconds = []
+    peak_rss = rss_growth = 0
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc.collect()
+        with RssSampler() as rss:
+            start = time.perf_counter()
+            result = run()
+            seconds.append(time.perf_counter() - start)
+        peak_rss = max(peak_rss, rss.peak)
+        rss_growth = max(rss_growth, rss.peak - rss.start)
+    allocated = None
+    if allocations:
+        if setup is not None:
+            setup()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run()
+            allocated = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, {
+        'seconds': min(seconds),
+        'mean_seconds': sum(seconds) / len(seconds),
+        'peak_rss_bytes': peak_rss,
+        'rss_growth_bytes': rss_growth,
+        'allocated_bytes': allocated,
+    }
+
+
+def dataset_path(rows, seed=0):
+    # Generated once per size and reused by later runs
+    path = BENCHMARK_DIR / f'orders_{rows}.csv'
+    if not path.exists():
+        BENCHMARK_DIR.mkdir(parents=True, exist_ok=True)
+        config = GeneratorConfig(rows=rows, customers=max(rows // 10, 1), seed=seed)
+        tmp = path.with_suffix('.tmp')
+        write_orders(config, tmp)
+        os.replace(tmp, path)
+    return path
+
+
+def remove_snapshot(path):
+    # Forces the next load_orders to parse and clean the CSV
+    snapshot = current_snapshot(path)
+    for derived in snapshot.parent.glob(f'{snapshot.stem}*'):
+        if derived.is_dir():
+            shutil.rmtree(derived)
+        else:
+            derived.unlink()
+
+
+# Per-section work over the filtered rows, as FilteredTotals does it for the whole dashboard
+SECTION_GROUPBYS = {
+    'metrics': lambda orders, rows, amount: FilteredTotals(orders, distinct_only=True).update(rows),
+    'sales_over_time': lambda orders, rows, amount: daily_sales(orders.column('order_date', rows), amount),
+    'sales_by_category': lambda orders, rows, amount: [
+        code_totals(orders.column(col, rows), total_amount=amount) for col in ['category', 'subcategory']],
+    'top_products': lambda orders, rows, amount: code_totals(
+        orders.column('product_name', rows), total_amount=amount,
+        quantity=orders.column('quantity', rows).to_numpy()),
+    'sales_by_day': lambda orders, rows, amount: code_totals(orders.column('day_of_week', rows), total_amount=amount),
+    'demographics': lambda orders, rows, amount: [
+        code_totals(orders.column(col, rows)) for col in ['age_group', 'gender']],
+    'payment_methods': lambda orders, rows, amount: code_totals(orders.column('payment_method', rows)),
+    'sales_by_country': lambda orders, rows, amount: code_totals(orders.column('country', rows), total_amount=amount),
+}
+
+
+def benchmark_size(rows, repeat, allocations, stages=None):
+    # Runs every stage on a dataset of rows orders and returns one result entry per stage.
+    # Stages left out by stages are still run (untimed) when later stages need their result.
+    path = str(dataset_path(rows))
+    results = []
+
+    def timed(stage, run, setup=None, processed=None, needed=False):
+        if stages and not any(stage.startswith(prefix) for prefix in stages):
+            return run() if needed else None
+        result, measurement = measure(run, setup, repeat, allocations)
+        results.append({'rows': rows, 'stage': stage,
+                        'rows_processed': None if processed is None else int(processed), **measurement})
+        print(f'{rows:>12,} {stage:<32} {measurement["seconds"] * 1000:>10.1f} ms', file=sys.stderr)
+        return result
+
+    timed('load_csv', lambda: load_orders(path, DASHBOARD_COLUMNS), setup=lambda: remove_snapshot(path),
+          processed=rows)
+    orders = timed('load_snapshot', lambda: load_orders(path, DASHBOARD_COLUMNS), processed=rows, needed=True)
+    filter_index = timed('filter_index', lambda: FilterIndex(orders), processed=len(orders), needed=True)
+
+    # The default view (everything selected) and a narrow one: one category over the middle
+    # half of the date range
+    dates = orders['order_date']
+    first, last = dates.iloc[0].date(), dates.iloc[-1].date()
+    everything = {col: filter_index.values(col) for col in FILTER_DIMENSIONS}
+    all_rows = date_range_slice(dates, first, last)
+    narrow = everything | {'category': everything['category'][:1]}
+    span = dates.iloc[-1] - dates.iloc[0]
+    narrow_rows = date_range_slice(dates, (dates.iloc[0] + span / 4).date(), (dates.iloc[-1] - span / 4).date())
+    mask = timed('mask_all', lambda: filter_index.mask(everything, all_rows), processed=len(orders), needed=True)
+    timed('mask_narrow', lambda: filter_index.mask(narrow, narrow_rows),
+          processed=narrow_rows.stop - narrow_rows.start)
+    filtered = all_rows.start + np.flatnonzero(mask)
+
+    amount = orders.column('total_amount', filtered).to_numpy()
+    for section, groupby in SECTION_GROUPBYS.items():
+        timed(f'groupby_{section}', lambda: groupby(orders, filtered, amount), processed=len(filtered))
+
+    def row_aggregates():
+        totals = FilteredTotals(orders)
+        totals.update(filtered)
+        return totals.aggregates()
+    aggregates = timed('aggregates_rows', row_aggregates, processed=len(filtered), needed=True)
+
+    def cube_aggregates():
+        cells = cubes['orders'].query(everything, first, last)
+        distinct_counts = (cubes['orders'].distinct_count('order_id', first, last),
+                           cubes['orders'].distinct_count('customer_id', first, last))
+        return compute_aggregates(cells, products=cubes['products'].query(everything, first, last),
+                                  distinct_counts=distinct_counts)
+    cubes = timed('cube_build', lambda: {name: OrderCube.build(orders, *CUBES[name]) for name in CUBES},
+                  processed=len(orders), needed=True)
+    timed('aggregates_cube', cube_aggregates, processed=len(cubes['orders'].cells))
+
+    for name, figure in FIGURES.items():
+        timed(f'figure_{name}', lambda: figure(aggregates))
+
+    columns = SECTION_COLUMNS['download']
+    with tempfile.TemporaryDirectory() as directory:
+        target = os.path.join(directory, 'export.csv')
+        timed('export_csv', lambda: write_csv(orders.with_columns(columns, filtered), None, columns, target),
+              processed=len(filtered))
+    return results
+
+
+def environment():
+    return {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'pyarrow': pa.__version__,
+    }
+
+
+def regressed(current, before, threshold, min_increase):
+    # Whether current exceeds before by more than threshold and min_increase, and the relative change
+    if current is None or before is None:
+        return False, None
+    change = current / before - 1 if before else 0.0
+    return change > threshold and current - before > min_increase, change
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD, memory_threshold=MEMORY_THRESHOLD):
+    # Stages slower or using more memory than the baseline by more than the thresholds, as
+    # (rows, stage, metric, value, baseline value)
+    previous = {(entry['rows'], entry['stage']): entry for entry in baseline['results']}
+    limits = {'seconds': (threshold, MIN_REGRESSION_SECONDS),
+              'peak_rss_bytes': (memory_threshold, MIN_REGRESSION_BYTES),
+              'allocated_bytes': (memory_threshold, MIN_REGRESSION_BYTES)}
+    regressions = []
+    print(f'{"rows":>12} {"stage":<32} {"baseline":>12} {"current":>12} {"change":>8} {"rss":>8} {"alloc":>8}')
+    for entry in results['results']:
+        before = previous.get((entry['rows'], entry['stage']))
+        if before is None:
+            continue
+        changes = {}
+        worse = []
+        for metric, (metric_threshold, min_increase) in limits.items():
+            regression, changes[metric] = regressed(entry.get(metric), before.get(metric), metric_threshold,
+                                                    min_increase)
+            if regression:
+                worse.append(metric)
+                regressions.append((entry['rows'], entry['stage'], metric, entry[metric], before[metric]))
+        memory = ' '.join('       -' if changes[metric] is None else f'{changes[metric]:>+7.0%}'
+                          for metric in ['peak_rss_bytes', 'allocated_bytes'])
+        flag = f'  REGRESSION ({", ".join(worse)})' if worse else ''
+        print(f'{entry["rows"]:>12,} {entry["stage"]:<32} {before["seconds"] * 1000:>9.1f} ms '
+              f'{entry["seconds"] * 1000:>9.1f} ms {changes["seconds"]:>+7.0%} {memory}{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the dashboard stages on generated datasets')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--stages', nargs='+', help='only run stages starting with one of these names')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-allocations', action='store_true',
+                        help='skip the extra run of every stage under tracemalloc')
+    parser.add_argument('--output', default=str(BENCHMARK_DIR / 'results.json'))
+    parser.add_argument('--baseline', default=str(BENCHMARK_DIR / 'baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument('--memory-threshold', type=float, default=MEMORY_THRESHOLD)
+    args = parser.parse_args()
+
+    results = {'environment': environment(), 'results': []}
+    for rows in args.sizes:
+        results['results'] += benchmark_size(rows, args.repeat, not args.no_allocations, args.stages)
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        Path(args.baseline).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.baseline).write_text(json.dumps(results, indent=2))
+    elif os.path.exists(args.baseline):
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.threshold,
+                              args.memory_threshold)
+        if regressions:
+            print(f'{len(regressions)} regression(s) against the baseline', file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
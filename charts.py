@@ -0,0 +1,70 @@
+import plotly.express as px
+
+
+# Plotly figures of the dashboard charts, each built from a DashboardAggregates bundle
+
+def sales_over_time_figure(aggregates):
+    return px.line(aggregates.sales_over_time, x='order_date', y='total_amount', title='Total Sales Over Time',
+                   labels={'order_date': 'Order Date', 'total_amount': 'Total Sales ($)'})
+
+
+def sales_by_category_figure(aggregates):
+    return px.bar(aggregates.sales_by_category, x='category', y='total_amount', title='Sales by Category',
+                  labels={'category': 'Category', 'total_amount': 'Total Sales ($)'})
+
+
+def sales_by_subcategory_figure(aggregates):
+    fig = px.bar(aggregates.sales_by_subcategory, x='subcategory', y='total_amount', title='Sales by Subcategory',
+                 labels={'subcategory': 'Subcategory', 'total_amount': 'Total Sales ($)'})
+    fig.update_layout(xaxis_tickangle=-45)
+    return fig
+
+
+def top_products_figure(aggregates):
+    fig = px.bar(aggregates.top_products, x='product_name', y='total_amount', title='Top 10 Products by Sales',
+                 labels={'product_name': 'Product Name', 'total_amount': 'Total Sales ($)'})
+    fig.update_layout(xaxis_tickangle=-45)
+    return fig
+
+
+def sales_by_day_figure(aggregates):
+    return px.bar(aggregates.sales_by_day, x='day_of_week', y='total_amount', title='Sales by Day of Week',
+                  labels={'day_of_week': 'Day of Week', 'total_amount': 'Total Sales ($)'})
+
+
+def age_group_figure(aggregates):
+    return px.bar(aggregates.age_group_counts, x='age_group', y='count', title='Age Group Distribution',
+                  labels={'age_group': 'Age Group', 'count': 'Number of Customers'})
+
+
+def gender_figure(aggregates):
+    return px.pie(aggregates.gender_counts, names='gender', values='count', title='Gender Distribution')
+
+
+def payment_methods_figure(aggregates):
+    return px.pie(aggregates.payment_counts, names='payment_method', values='count', title='Payment Methods')
+
+
+def sales_by_country_figure(aggregates):
+    return px.choropleth(
+        aggregates.sales_by_country,
+        locations='country',
+        locationmode='country names',
+        color='total_amount',
+        title='Sales by Country',
+        color_continuous_scale='Blues',
+        labels={'total_amount': 'Total Sales ($)'}
+    )
+
+
+FIGURES = {
+    'sales_over_time': sales_over_time_figure,
+    'sales_by_category': sales_by_category_figure,
+    'sales_by_subcategory': sales_by_subcategory_figure,
+    'top_products': top_products_figure,
+    'sales_by_day': sales_by_day_figure,
+    'age_group': age_group_figure,
+    'gender': gender_figure,
+    'payment_methods': payment_methods_figure,
+    'sales_by_country': sales_by_country_figure,
+}
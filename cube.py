@@ -0,0 +1,156 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data_loader import DAYS_OF_WEEK, freeze_frame, write_parquet
+from sketches import DistinctSketch
+
+# Bump whenever OrderCube.build changes its output so persisted cubes are rebuilt
+CUBE_VERSION = 3
+
+# Every chart except Top 10 Products can be answered from the orders cube; products get a
+# cube of their own over the filter dimensions so the main cube stays small.
+# The orders cube also keeps per-day distinct-count sketches of the order and customer keys.
+CUBES = {
+    'orders': (['category', 'subcategory', 'gender', 'age_group', 'payment_method', 'country'],
+               ['order_id', 'customer_id']),
+    'products': (['product_name', 'category', 'subcategory', 'gender', 'age_group', 'payment_method'],
+                 []),
+}
+MEASURES = ['total_amount', 'quantity']
+
+
+def date_slot(timestamps):
+    # Two time slots per day: orders exactly at midnight and the rest of the day. The sidebar
+    # compares order_date with midnight bounds, so this keeps cube answers exact.
+    values = timestamps.astype('datetime64[us]').view(np.int64)
+    days = values // (86_400 * 1_000_000)
+    return days * 2 + (values != days * 86_400 * 1_000_000)
+
+
+class OrderCube:
+    # Sums and row counts of MEASURES per day slot and combination of dimension values,
+    # stored as a frame of cells sorted by slot
+    def __init__(self, cells, dimensions, sketches=None):
+        self.cells = cells
+        self.dimensions = dimensions
+        self.sketches = sketches or {}
+        self.slots = cells['slot'].to_numpy()
+
+    @classmethod
+    def build(cls, df, dimensions, sketch_columns=()):
+        slots = date_slot(df['order_date'].to_numpy())
+        first_slot = slots.min() if len(df) else 0
+        codes = [slots - first_slot]
+        shape = [codes[0].max() + 1 if len(df) else 1]
+        for col in dimensions:
+            # Shift by one so missing values get code 0
+            codes.append(df[col].cat.codes.to_numpy().astype(np.int64) + 1)
+            shape.append(len(df[col].cat.categories) + 1)
+        keys = np.ravel_multi_index(codes, shape)
+        cell_keys, cell_of_row = np.unique(keys, return_inverse=True)
+        cell_codes = np.unravel_index(cell_keys, shape)
+
+        cells = pd.DataFrame({'slot': cell_codes[0] + first_slot})
+        days = (cells['slot'].to_numpy() // 2).astype('datetime64[D]')
+        cells['order_date'] = pd.to_datetime(days)
+        cells['day_of_week'] = pd.Categorical.from_codes(cells['order_date'].dt.dayofweek, categories=DAYS_OF_WEEK)
+        for col, col_codes in zip(dimensions, cell_codes[1:]):
+            cells[col] = pd.Categorical.from_codes(col_codes - 1, dtype=df[col].dtype)
+        for measure in MEASURES:
+            cells[measure] = np.bincount(cell_of_row, weights=df[measure].to_numpy(), minlength=len(cell_keys))
+        cells['rows'] = np.bincount(cell_of_row, minlength=len(cell_keys))
+        sketches = {col: DistinctSketch.build(df[col], slots) for col in sketch_columns}
+        return cls(cells, dimensions, sketches)
+
+    def merge(self, other):
+        # Cube over the orders of both cubes, e.g. the cube of newly appended orders merged into
+        # the existing one. Dimension categories must already match.
+        cells = pd.concat([self.cells, other.cells], ignore_index=True)
+        slots = cells['slot'].to_numpy()
+        codes = [slots - slots.min()]
+        shape = [codes[0].max() + 1]
+        for col in self.dimensions:
+            codes.append(cells[col].cat.codes.to_numpy().astype(np.int64) + 1)
+            shape.append(len(cells[col].cat.categories) + 1)
+        keys = np.ravel_multi_index(codes, shape)
+        cell_keys, first, cell_of_row = np.unique(keys, return_index=True, return_inverse=True)
+
+        merged = cells.iloc[first].reset_index(drop=True)
+        for measure in MEASURES:
+            merged[measure] = np.bincount(cell_of_row, weights=cells[measure].to_numpy(), minlength=len(cell_keys))
+        merged['rows'] = np.bincount(cell_of_row, weights=cells['rows'].to_numpy(),
+                                     minlength=len(cell_keys)).astype(np.int64)
+        sketches = {col: sketch.merge(other.sketches[col]) for col, sketch in self.sketches.items()}
+        return OrderCube(merged, self.dimensions, sketches)
+
+    def query(self, selections, start_date, end_date):
+        # Cells within the date range whose dimension values are all selected
+        bounds = date_slot(pd.to_datetime([start_date, end_date]).to_numpy())
+        start = self.slots.searchsorted(bounds[0], side='left')
+        end = self.slots.searchsorted(bounds[1], side='right')
+        cells = self.cells.iloc[start:end]
+        mask = np.ones(len(cells), dtype=bool)
+        for col, selected in selections.items():
+            if col not in self.dimensions:
+                continue
+            series = cells[col]
+            allowed = np.zeros(len(series.cat.categories) + 1, dtype=bool)
+            allowed[0] = any(pd.isna(v) for v in selected)
+            positions = series.cat.categories.get_indexer([v for v in selected if not pd.isna(v)])
+            allowed[positions[positions >= 0] + 1] = True
+            mask &= allowed[series.cat.codes.to_numpy().astype(np.intp) + 1]
+        return cells[mask]
+
+    def distinct_count(self, col, start_date, end_date):
+        # Approximate distinct values of col over the orders in the date range; the sketches are
+        # kept per day, so other filters cannot be applied to them
+        bounds = date_slot(pd.to_datetime([start_date, end_date]).to_numpy())
+        return self.sketches[col].estimate(bounds[0], bounds[1])
+
+
+def cube_path(snapshot, name, part='cells'):
+    return Path(snapshot).with_name(f'{Path(snapshot).stem}.{name}-cube-v{CUBE_VERSION}.{part}.parquet')
+
+
+def read_cube(snapshot, name, dimensions, sketch_columns):
+    parts = ['cells'] + [f'{col}-sketch' for col in sketch_columns]
+    paths = [cube_path(snapshot, name, part) for part in parts]
+    if not all(path.exists() for path in paths):
+        return None
+    try:
+        frames = [pd.read_parquet(path) for path in paths]
+    except Exception:
+        return None
+    sketches = {col: DistinctSketch.from_frame(frame) for col, frame in zip(sketch_columns, frames[1:])}
+    return OrderCube(frames[0], dimensions, sketches)
+
+
+def write_cube(cube, snapshot, name):
+    snapshot = Path(snapshot)
+    for old in snapshot.parent.glob(f'{snapshot.stem}.{name}-cube-v*.parquet'):
+        if not old.name.startswith(f'{snapshot.stem}.{name}-cube-v{CUBE_VERSION}.'):
+            old.unlink(missing_ok=True)
+    try:
+        write_parquet(cube.cells, cube_path(snapshot, name))
+        for col, sketch in cube.sketches.items():
+            write_parquet(sketch.to_frame(), cube_path(snapshot, name, f'{col}-sketch'))
+    except OSError:
+        pass
+
+
+def load_cubes(snapshot, load_frame):
+    # Cubes are persisted next to the data snapshot. load_frame is only called to rebuild a
+    # missing cube, so the orders need not be in memory (e.g. with a partitioned store).
+    cubes = {}
+    df = None
+    for name, (dimensions, sketch_columns) in CUBES.items():
+        cube = read_cube(snapshot, name, dimensions, sketch_columns) if snapshot else None
+        if cube is None:
+            df = load_frame() if df is None else df
+            cube = OrderCube.build(df, dimensions, sketch_columns)
+            if snapshot:
+                write_cube(cube, snapshot, name)
+        cubes[name] = OrderCube(freeze_frame(cube.cells), dimensions, cube.sketches)
+    return cubes
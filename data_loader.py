@@ -0,0 +1,899 @@
+import functools
+import hashlib
+import io
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+import numpy as np
+
+DATA_FILE = 'synthetic_ecommerce_orders.csv'
+
+# Cleaned frames are persisted here so restarts and new workers can skip the CSV parse
+SNAPSHOT_DIR = Path(os.environ.get('DASHBOARD_SNAPSHOT_DIR', '.snapshots'))
+
+# CSVs larger than this are cleaned in chunks of CHUNK_ROWS rows straight into the snapshot,
+# so peak memory during ingestion depends on the chunk size rather than the file size
+STREAM_THRESHOLD_BYTES = int(os.environ.get('DASHBOARD_STREAM_THRESHOLD_MB', 256)) * 1024 * 1024
+CHUNK_ROWS = int(os.environ.get('DASHBOARD_CHUNK_ROWS', 500_000))
+
+# Bump whenever clean_orders changes its output so older snapshots are ignored
+PIPELINE_VERSION = 8
+
+# Declared schema of the order export, handed straight to the CSV parser.
+# Integers are nullable while parsing so '?' rows can still be dropped, then narrowed to
+# numpy dtypes. quantity stays int32 because groupby sums keep the column dtype.
+# Money columns stay float64 so revenue totals match to the cent.
+ORDER_DTYPES = {
+    'order_id': 'str',
+    'customer_id': 'str',
+    'product_id': 'str',
+    'quantity': 'Int32',
+    'order_price': 'float64',
+    'total_amount': 'float64',
+    'product_name': 'category',
+    'category': 'category',
+    'subcategory': 'category',
+    'product_price': 'float64',
+    'customer_name': 'str',
+    'city': 'str',
+    'state': 'category',
+    'country': 'category',
+    'age': 'Int8',
+    'gender': 'category',
+    'payment_method': 'category',
+    'shipping_address': 'str',
+}
+DATE_COLUMNS = ['order_date']
+
+# UUID keys are replaced by dense int32 surrogate keys in the snapshot; the UUIDs are kept in
+# a dictionary file per column and only read back for exports and drill-downs
+KEY_COLUMNS = ['order_id', 'customer_id', 'product_id']
+
+# Star schema: product and customer attributes are stored once per distinct combination in
+# dimension tables, and the order facts reference them by integer key
+STAR_DIMENSIONS = {
+    'product_key': ('products', ['product_id', 'product_name', 'category', 'subcategory', 'product_price']),
+    'customer_key': ('customers', ['customer_id', 'customer_name', 'city', 'state', 'country', 'age',
+                                   'gender', 'age_group']),
+}
+ORDER_COLUMNS = (['order_id', 'order_date'] + list(ORDER_DTYPES)[1:]
+                 + ['month', 'year', 'day_of_week', 'hour', 'age_group'])
+
+# Columns each dashboard section reads. load_orders can be limited to the sections rendered
+# on every run; the rest (e.g. the free-text export columns) is read from the snapshot on demand.
+SECTION_COLUMNS = {
+    'filters': ['order_date', 'category', 'subcategory', 'gender', 'age_group', 'payment_method'],
+    'metrics': ['total_amount', 'order_id', 'customer_id'],
+    'sales_over_time': ['order_date', 'total_amount'],
+    'sales_by_category': ['category', 'subcategory', 'total_amount'],
+    'top_products': ['product_name', 'quantity', 'total_amount'],
+    'sales_by_day': ['day_of_week', 'total_amount'],
+    'demographics': ['age_group', 'gender'],
+    'payment_methods': ['payment_method'],
+    'sales_by_country': ['country', 'total_amount'],
+    'download': ORDER_COLUMNS,
+}
+DAYS_OF_WEEK = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+NA_MARKERS = ['?']
+
+
+def section_columns(sections):
+    return list(dict.fromkeys(col for section in sections for col in SECTION_COLUMNS[section]))
+
+
+class FilePrefix(io.RawIOBase):
+    # The first length bytes of a file, e.g. the complete lines of a CSV still being appended to
+    def __init__(self, path, length):
+        self.file = open(path, 'rb')
+        self.remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.file.read(min(len(buffer), self.remaining))
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+def read_orders_csv(path, typed=True, length=None, **kwargs):
+    # length limits the parse to the first length bytes of the file
+    if length is not None:
+        path = io.BufferedReader(FilePrefix(path, length))
+    if typed:
+        return pd.read_csv(path, dtype=ORDER_DTYPES, parse_dates=DATE_COLUMNS,
+                           na_values=NA_MARKERS, **kwargs)
+    # Untyped fallback for files with malformed numeric fields, normalize_values coerces them
+    return pd.read_csv(path, na_values=NA_MARKERS, **kwargs)
+
+
+def normalize_values(df):
+    # 1. Handle Missing Values
+    # '?' markers are already parsed as NaN by read_orders_csv
+    df.dropna(inplace=True)  # Alternatively, you can fill missing values
+
+    # 2. Data Type Conversions
+    # The parser has typed these already, only an untyped fallback read needs converting
+    if not pd.api.types.is_datetime64_any_dtype(df['order_date']):
+        df['order_date'] = pd.to_datetime(df['order_date'])
+    numeric_columns = ['quantity', 'order_price', 'total_amount', 'age']
+    for col in numeric_columns:
+        if isinstance(df[col].dtype, pd.api.extensions.ExtensionDtype) and df[col].dtype.kind in 'iuf':
+            df[col] = df[col].astype(df[col].dtype.numpy_dtype)
+        elif not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    return df
+
+
+def add_features(df):
+    # 4. Feature Engineering
+    # Extract date-related features
+    df['month'] = df['order_date'].dt.month
+    df['year'] = df['order_date'].dt.year
+    df['day_of_week'] = pd.Categorical.from_codes(df['order_date'].dt.dayofweek, categories=DAYS_OF_WEEK)
+    df['hour'] = df['order_date'].dt.hour
+
+    # Create age groups
+    df['age_group'] = pd.cut(df['age'], bins=[17, 24, 34, 44, 54, 64, np.inf],
+                             labels=['18-24', '25-34', '35-44', '45-54', '55-64', '65+'])
+
+    # 5. Standardize Categorical Variables
+    categorical_columns = ['gender', 'payment_method', 'category', 'subcategory', 'product_name', 'country']
+    for col in categorical_columns:
+        df[col] = standardize_categories(df[col])
+
+    return df
+
+
+def standardize_categories(series):
+    # Strip and title-case the category dictionary instead of every row, merging
+    # categories that collapse to the same label (e.g. 'male ' and 'Male')
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype('category')
+    labels = series.cat.categories.str.strip().str.title()
+    remap, categories = pd.factorize(labels, sort=True)
+    codes = series.cat.codes.to_numpy()
+    codes = np.where(codes >= 0, remap[codes], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories),
+                     index=series.index, name=series.name)
+
+
+def clean_orders(df):
+    df = normalize_values(df)
+
+    # 3. Remove Duplicates
+    df.drop_duplicates(inplace=True)
+
+    return sort_by_date(add_features(df))
+
+
+def sort_by_date(df):
+    # Orders are kept physically sorted by date so a date range is a contiguous row slice
+    if df['order_date'].is_monotonic_increasing:
+        return df
+    return df.sort_values('order_date', kind='stable')
+
+
+def read_only(arr):
+    view = arr.view()
+    view.flags.writeable = False
+    return view
+
+
+class ReadOnlyStringArray(pd.arrays.ArrowStringArray):
+    # Arrow-backed strings whose in-place writes raise like those of a read-only numpy array.
+    # pandas writes to an ArrowStringArray by swapping in a new Arrow array, which every frame
+    # sharing the array object would see. Results of operations on it are writable arrays again.
+    def __setitem__(self, key, value):
+        raise ValueError('assignment destination is read-only')
+
+    def _from_pyarrow_array(self, pa_array):
+        return pd.arrays.ArrowStringArray(pa_array, dtype=self.dtype)
+
+
+def freeze_frame(df):
+    # Rebuild df over read-only views of its column arrays, so one instance can be shared
+    # by every session and an in-place write raises instead of leaking into other sessions
+    columns = {}
+    for col, series in df.items():
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes = read_only(series.cat.codes.to_numpy())
+            columns[col] = pd.Categorical.from_codes(codes, dtype=series.dtype, validate=False)
+        elif isinstance(series.dtype, np.dtype):
+            columns[col] = read_only(series.to_numpy())
+        elif isinstance(series.array, pd.arrays.ArrowStringArray):
+            # Shares the immutable Arrow buffers
+            columns[col] = ReadOnlyStringArray(series.array.__arrow_array__(), dtype=series.dtype)
+        else:
+            columns[col] = series.array
+    frozen = pd.DataFrame(columns, index=df.index, copy=False)
+    frozen.attrs.update(df.attrs)
+    return frozen
+
+
+def file_digest(path, length=None, chunk_size=1 << 20):
+    # Digest of the file, or of its first length bytes
+    digest = hashlib.sha256()
+    with open(path, 'rb') if length is None else io.BufferedReader(FilePrefix(path, length)) as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def snapshot_path(path, digest):
+    return SNAPSHOT_DIR / f'{Path(path).stem}-{digest[:16]}-v{PIPELINE_VERSION}.parquet'
+
+
+def current_snapshot(path, length=None):
+    # Snapshot of the file, or of its first length bytes (see load_orders)
+    stat = os.stat(path)
+    return cached_snapshot_path(path, stat.st_mtime_ns, stat.st_size, length)
+
+
+@functools.lru_cache(maxsize=16)
+def cached_snapshot_path(path, mtime_ns, size, length=None):
+    # Hashing a large export is slow, so the digest is reused while the file is unchanged
+    return snapshot_path(path, file_digest(path, length))
+
+
+def write_parquet(df, target):
+    target.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temp file and rename so a concurrent reader never sees a partial file
+    fd, tmp = tempfile.mkstemp(dir=target.parent, suffix='.tmp')
+    os.close(fd)
+    try:
+        df.to_parquet(tmp)
+        os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def write_snapshot(df, snapshot, path):
+    write_parquet(df, snapshot)
+    prune_snapshots(snapshot, path)
+
+
+def snapshot_generation(name, path):
+    # Stem of the snapshot of path that name belongs to (the snapshot itself or a file derived
+    # from it), None for files of other sources whose name starts with the same stem
+    stem = re.escape(Path(path).stem)
+    match = re.fullmatch(rf'({stem}-[0-9a-f]{{16}}-v\d+)(\..*)?', name)
+    return match and match.group(1)
+
+
+def written_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def prune_snapshots(snapshot, path):
+    # Drop snapshots (and files derived from them) of older versions of the same source file. The
+    # newest of those is kept: it is the one being replaced, and a version loaded from it may still
+    # be read (e.g. by the export of a page rendered before a refresh swapped versions).
+    generations = {}
+    for file in snapshot.parent.glob(f'{Path(path).stem}-*'):
+        generation = snapshot_generation(file.name, path)
+        if generation is not None and generation != snapshot.stem:
+            generations.setdefault(generation, []).append(file)
+    older = sorted(generations, key=lambda generation: written_ns(snapshot.parent / f'{generation}.parquet'))
+    for generation in older[:-1]:
+        for old in generations[generation]:
+            if old.is_dir():
+                shutil.rmtree(old, ignore_errors=True)
+            elif old.suffix == '.parquet':
+                old.unlink(missing_ok=True)
+
+
+def key_dictionary_path(snapshot, col):
+    return Path(snapshot).with_name(f'{Path(snapshot).stem}.{col}-keys.parquet')
+
+
+def encode_key_column(values, snapshot, col):
+    # Surrogate key i stands for row i of the dictionary file
+    codes, uniques = pd.factorize(values)
+    write_parquet(pd.DataFrame({'key': uniques}), key_dictionary_path(snapshot, col))
+    return codes.astype(np.int32 if len(uniques) < 2 ** 31 else np.int64)
+
+
+def encode_keys(df, snapshot):
+    codes = {col: encode_key_column(df[col], snapshot, col) for col in KEY_COLUMNS}
+    for col, col_codes in codes.items():
+        df[col] = col_codes
+    return df
+
+
+def load_key_dictionary(snapshot, col, appended=()):
+    # Not cached: the order_id dictionary holds one UUID per order. appended are arrays of keys
+    # numbered after the file's (see OrderTables.appended_keys).
+    dictionary = pd.read_parquet(key_dictionary_path(snapshot, col))['key'].array
+    if appended:
+        dictionary = pd.concat([pd.Series(values) for values in [dictionary, *appended]], ignore_index=True).array
+    return dictionary
+
+
+def decode_keys(frame, dictionaries=None, appended_keys=None):
+    # Swap surrogate keys back to the original UUIDs, e.g. before exporting rows. Dictionaries read
+    # are kept in dictionaries (by column), so the chunks of one export read each file only once.
+    # appended_keys holds the keys of the frame's tables missing from the files (see OrderTables).
+    snapshot = frame.attrs.get('snapshot')
+    dictionaries = {} if dictionaries is None else dictionaries
+    appended_keys = appended_keys or {}
+    decoded = {}
+    for col in KEY_COLUMNS:
+        if col in frame and snapshot and pd.api.types.is_integer_dtype(frame[col]):
+            if col not in dictionaries:
+                dictionaries[col] = load_key_dictionary(snapshot, col, appended_keys.get(col, ()))
+            decoded[col] = dictionaries[col].take(frame[col].to_numpy())
+    return frame.assign(**decoded) if decoded else frame
+
+
+def contiguous(rows):
+    # Ascending positions without gaps (e.g. every order in the date range selected) become a
+    # slice, so columns are read through views instead of gathered into copies
+    if isinstance(rows, np.ndarray) and len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+        return slice(int(rows[0]), int(rows[-1]) + 1)
+    return rows
+
+
+class OrderTables:
+    # The cleaned orders as a star schema: a narrow fact table plus the dimension tables.
+    # Indexing by column name returns a full-length column like a DataFrame would, dimension
+    # attributes are gathered through the fact table's keys on access. appended_keys holds, per
+    # key column, arrays of the keys numbered after the snapshot's dictionary file (orders
+    # appended in memory, see IncrementalOrders); published dictionary files are never rewritten.
+    def __init__(self, facts, products, customers, appended_keys=None):
+        self.facts = facts
+        self.dimensions = {'product_key': products, 'customer_key': customers}
+        self.appended_keys = appended_keys or {}
+        self.sources = {col: key for key, table in self.dimensions.items() for col in table.columns}
+
+    @property
+    def products(self):
+        return self.dimensions['product_key']
+
+    @property
+    def customers(self):
+        return self.dimensions['customer_key']
+
+    @property
+    def attrs(self):
+        return self.facts.attrs
+
+    @property
+    def columns(self):
+        return [col for col in ORDER_COLUMNS if col in self]
+
+    def __len__(self):
+        return len(self.facts)
+
+    def dtype(self, col):
+        table = self.facts if col in self.facts else self.dimensions[self.sources[col]]
+        return table[col].dtype
+
+    def __contains__(self, col):
+        return col in self.facts or col in self.sources
+
+    def __getitem__(self, col):
+        if isinstance(col, list):
+            return self.frame(columns=col)
+        return self.column(col)
+
+    def column(self, col, rows=slice(None)):
+        # col of the orders at rows, a slice or an array of ascending positions (a selection
+        # vector); only this one column is gathered
+        rows = contiguous(rows)
+        if col in self.facts:
+            return self.facts[col].iloc[rows]
+        key = self.sources[col]
+        keys = self.facts[key].to_numpy()[rows]
+        return pd.Series(self.dimensions[key][col].array.take(keys), index=self.facts.index[rows], name=col)
+
+    def frame(self, rows=slice(None), columns=None):
+        # Wide (denormalized) rows, e.g. for exports
+        columns = self.columns if columns is None else columns
+        frame = pd.DataFrame({col: self.column(col, rows) for col in columns})
+        frame.attrs.update(self.attrs)
+        return frame
+
+    def map(self, func):
+        return OrderTables(func(self.facts), func(self.products), func(self.customers), self.appended_keys)
+
+    def project(self, columns):
+        # Only the given columns, plus the keys joining the dimensions
+        fact_columns, dimension_columns = star_projection(columns)
+        return OrderTables(self.facts[fact_columns],
+                           *(self.dimensions[key][dimension_columns[key]] for key in STAR_DIMENSIONS),
+                           self.appended_keys)
+
+    def with_columns(self, columns, rows=slice(None)):
+        # The orders at rows (a slice or ascending positions) with the columns left out by
+        # load_orders read back from the snapshot, e.g. for an export. Only the row groups holding
+        # those orders are read.
+        positions = np.arange(len(self))[rows] if isinstance(rows, slice) else np.asarray(rows)
+        facts = self.facts.iloc[positions]
+        missing = [col for col in columns if col not in self]
+        snapshot = self.attrs.get('snapshot')
+        fact_columns, dimension_columns = star_projection(missing)
+        fact_columns = [col for col in fact_columns if col not in facts]
+        if fact_columns:
+            extra = read_fact_rows(snapshot, fact_columns, positions, self.attrs.get('months'))
+            extra.index = facts.index
+            facts = pd.concat([facts, extra], axis=1)
+        facts.attrs.update(self.attrs)
+        dimensions = []
+        for key, (name, _) in STAR_DIMENSIONS.items():
+            table = self.dimensions[key]
+            if dimension_columns[key]:
+                extra = pd.read_parquet(dimension_path(snapshot, name), columns=dimension_columns[key])
+                table = pd.concat([table, extra], axis=1) if len(table.columns) else extra
+            dimensions.append(table)
+        return OrderTables(facts, *dimensions, self.appended_keys)
+
+
+def star_projection(columns):
+    # Fact table columns (including the dimension keys) and per-dimension columns holding columns
+    fact_columns = []
+    dimension_columns = {key: [] for key in STAR_DIMENSIONS}
+    for col in columns:
+        for key, (_, attributes) in STAR_DIMENSIONS.items():
+            if col in attributes:
+                dimension_columns[key].append(col)
+                break
+        else:
+            fact_columns.append(col)
+    return fact_columns + list(STAR_DIMENSIONS), dimension_columns
+
+
+def split_dimension(df, columns):
+    # Key of every row into a table of the distinct attribute combinations
+    keys = df.groupby(columns, sort=False, observed=True, dropna=False).ngroup().to_numpy()
+    first = np.unique(keys, return_index=True)[1]
+    return keys.astype(np.int32), df[columns].iloc[first].reset_index(drop=True)
+
+
+def split_star(df):
+    dimension_columns = [col for _, columns in STAR_DIMENSIONS.values() for col in columns]
+    facts = df.drop(columns=dimension_columns)
+    tables = {}
+    for key, (name, columns) in STAR_DIMENSIONS.items():
+        facts[key], tables[name] = split_dimension(df, columns)
+    return OrderTables(facts, tables['products'], tables['customers'])
+
+
+def dimension_path(snapshot, name):
+    return Path(snapshot).with_name(f'{Path(snapshot).stem}.{name}.parquet')
+
+
+def read_facts(snapshot, columns=None, months=None):
+    # Facts are stored sorted by date, so they are read in order. months limits the read to
+    # those monthly partitions (see write_partitions).
+    if months is None:
+        return pd.read_parquet(snapshot, columns=columns)
+    paths = [partition_path(snapshot, month) for month in months]
+    if paths:
+        return pd.concat([pd.read_parquet(path, columns=columns) for path in paths])
+    # Empty date range, still typed like the other partitions
+    first = sorted(partition_dir(snapshot).glob('*.parquet'))[0]
+    return pd.read_parquet(first, columns=columns).iloc[:0]
+
+
+def read_fact_rows(snapshot, columns, rows, months=None):
+    # columns of the facts at rows, ascending positions into the facts as read_facts returns them
+    # (the stored order), reading only the row groups that hold those rows
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if months is None:
+        paths = [snapshot]
+    else:
+        paths = [partition_path(snapshot, month) for month in months]
+    parts = []
+    offset = 0
+    for path in paths:
+        file = pq.ParquetFile(path)
+        for i in range(file.num_row_groups):
+            size = file.metadata.row_group(i).num_rows
+            lo, hi = np.searchsorted(rows, [offset, offset + size])
+            if hi > lo:
+                parts.append(file.read_row_group(i, columns=columns).take(rows[lo:hi] - offset))
+            offset += size
+    if not parts:
+        # No rows, still typed like the stored columns
+        first = paths[0] if paths else sorted(partition_dir(snapshot).glob('*.parquet'))[0]
+        parts.append(pq.ParquetFile(first).schema_arrow.empty_table().select(columns))
+    return pa.concat_tables(parts).to_pandas()
+
+
+def read_tables(snapshot, columns=None, months=None):
+    if columns is None:
+        dimension_columns = dict.fromkeys(STAR_DIMENSIONS)
+        facts = read_facts(snapshot, months=months)
+    else:
+        fact_columns, dimension_columns = star_projection(columns)
+        facts = read_facts(snapshot, fact_columns, months)
+    products = pd.read_parquet(dimension_path(snapshot, 'products'), columns=dimension_columns['product_key'])
+    customers = pd.read_parquet(dimension_path(snapshot, 'customers'), columns=dimension_columns['customer_key'])
+    return OrderTables(facts, products, customers)
+
+
+def partition_dir(snapshot):
+    return Path(snapshot).with_name(f'{Path(snapshot).stem}.months')
+
+
+def partition_path(snapshot, month):
+    return partition_dir(snapshot) / f'{month}.parquet'
+
+
+def write_partitions(snapshot):
+    # Copy the snapshot facts into one file per calendar month (YYYY-MM.parquet). The directory
+    # is filled under a temporary name and renamed, so readers never see a partial set of months.
+    target = partition_dir(snapshot)
+    facts = read_facts(snapshot)
+    tmp = tempfile.mkdtemp(dir=target.parent, suffix='.tmp')
+    try:
+        months = facts['order_date'].dt.strftime('%Y-%m').to_numpy()
+        bounds = np.flatnonzero(months[1:] != months[:-1]) + 1
+        for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(facts)]):
+            facts.iloc[start:end].to_parquet(Path(tmp) / f'{months[start]}.parquet')
+        os.replace(tmp, target)
+    except OSError:
+        # Another process got there first, or the directory is read-only
+        if not target.exists():
+            raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def stored_months(snapshot, start_date=None, end_date=None):
+    # Months with a partition, optionally only those overlapping start_date..end_date
+    if not partition_dir(snapshot).exists():
+        write_partitions(snapshot)
+    months = sorted(path.stem for path in partition_dir(snapshot).glob('*.parquet'))
+    if start_date is not None:
+        months = [month for month in months if pd.Timestamp(start_date).strftime('%Y-%m') <= month]
+    if end_date is not None:
+        months = [month for month in months if month <= pd.Timestamp(end_date).strftime('%Y-%m')]
+    return months
+
+
+def order_date_bounds(path=DATA_FILE):
+    # First and last order date, read from the first and last monthly partition only
+    snapshot = current_snapshot(path)
+    if not snapshot.exists():
+        load_orders(path, columns=[])
+    months = stored_months(snapshot)
+    first = pd.read_parquet(partition_path(snapshot, months[0]), columns=['order_date'])['order_date']
+    last = pd.read_parquet(partition_path(snapshot, months[-1]), columns=['order_date'])['order_date']
+    return first.min(), last.max()
+
+
+def store_snapshot(df, snapshot, path):
+    try:
+        df = encode_keys(df, snapshot)
+    except OSError:
+        pass
+    tables = split_star(df)
+    try:
+        write_parquet(tables.products, dimension_path(snapshot, 'products'))
+        write_parquet(tables.customers, dimension_path(snapshot, 'customers'))
+        write_snapshot(tables.facts, snapshot, path)
+    except OSError:
+        # A read-only deployment still works, it just re-cleans on every cold start
+        pass
+    return tables
+
+
+def value_hashes(values):
+    # 64-bit hash of every value of a Series or row of a DataFrame
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+
+class HashLookup:
+    # Numbers distinct values in order of first appearance across chunks, like pd.factorize of
+    # all of them would. Values seen are recognized by a sorted array of their 64-bit hashes
+    # (16 bytes per distinct value with its number) instead of being kept themselves.
+    def __init__(self):
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.numbers = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def find(self, hashes):
+        # Number of every hash, -1 for hashes not seen yet
+        if not len(self.hashes):
+            return np.full(len(hashes), -1, dtype=np.int64)
+        # Searching in sorted order keeps the binary searches cache friendly
+        order = np.argsort(hashes)
+        pos = np.empty(len(hashes), dtype=np.intp)
+        pos[order] = np.searchsorted(self.hashes, hashes[order])
+        pos = pos.clip(max=len(self.hashes) - 1)
+        return np.where(self.hashes[pos] == hashes, self.numbers[pos], -1)
+
+    def add(self, hashes):
+        # Number hashes (distinct and not seen yet) after the ones seen so far
+        numbers = np.concatenate([self.numbers, np.arange(len(self), len(self) + len(hashes))])
+        hashes = np.concatenate([self.hashes, hashes])
+        order = np.argsort(hashes, kind='stable')
+        self.hashes, self.numbers = hashes[order], numbers[order]
+
+    def encode(self, hashes):
+        # Numbers of hashes, numbering unseen ones as they first appear, and the positions of
+        # those first appearances
+        numbers = self.find(hashes)
+        new = np.flatnonzero(numbers < 0)
+        first = new[np.sort(np.unique(hashes[new], return_index=True)[1])]
+        if len(first):
+            self.add(hashes[first])
+            numbers[new] = self.find(hashes[new])
+        return numbers, first
+
+
+class StagedParquet:
+    # A Parquet file written one table at a time under a temporary name; commit() renames it into
+    # place, so a concurrent reader never sees a partial file
+    def __init__(self, target):
+        self.target = Path(target)
+        fd, self.tmp = tempfile.mkstemp(dir=self.target.parent, suffix='.tmp')
+        os.close(fd)
+        self.writer = None
+
+    def write(self, table):
+        import pyarrow.parquet as pq
+
+        # The pandas metadata of the staged file still describes the key columns as strings
+        table = table.replace_schema_metadata(None)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.tmp, table.schema)
+        self.writer.write_table(table)
+
+    def commit(self):
+        self.writer.close()
+        self.writer = None
+        os.replace(self.tmp, self.target)
+
+    def discard(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+
+def fact_categories(staged, columns):
+    # Categories of every dictionary column among columns over all row groups of the staged file.
+    # Row groups that agree keep their dictionary (e.g. day_of_week in weekday order); otherwise
+    # the union is sorted, as read_csv and standardize_categories list them for a file cleaned in
+    # memory. Only the dictionaries are kept, not the rows.
+    import pyarrow as pa
+
+    columns = [col for col in columns if pa.types.is_dictionary(staged.schema_arrow.field(col).type)]
+    dictionaries = {col: [] for col in columns}
+    for i in range(staged.num_row_groups):
+        table = staged.read_row_group(i, columns=columns)
+        for col in columns:
+            dictionaries[col].extend(chunk.dictionary for chunk in table.column(col).chunks)
+    categories = {}
+    for col, found in dictionaries.items():
+        if found and all(dictionary.equals(found[0]) for dictionary in found):
+            categories[col] = found[0]
+        else:
+            values = pa.concat_arrays(found).unique() if found else pa.array([], pa.string())
+            categories[col] = values.take(values.to_pandas().argsort(kind='stable').to_numpy())
+    return categories
+
+
+def recode_dictionary(column, categories):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    # The dictionary column re-encoded against categories, which hold all of its values
+    chunks = []
+    for chunk in column.chunks:
+        positions = pc.index_in(chunk.dictionary, value_set=categories)
+        indices = positions.take(chunk.indices).cast(pa.int32())
+        chunks.append(pa.DictionaryArray.from_arrays(indices, categories, ordered=chunk.type.ordered))
+    return pa.chunked_array(chunks, pa.dictionary(pa.int32(), categories.type, column.type.ordered))
+
+
+def split_months(table):
+    # Rows of table by calendar month of their order date, each part in row order
+    months = table.column('order_date').to_numpy().astype('datetime64[M]')
+    order = np.argsort(months, kind='stable')
+    months = months[order]
+    bounds = np.flatnonzero(months[1:] != months[:-1]) + 1
+    for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(months)]):
+        yield str(months[start]), table.take(order[start:end])
+
+
+def finish_staged_snapshot(source, target):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    # Second pass over a chunk-ingested file, one row group at a time: replace the keys by
+    # surrogate keys, split the dimension attributes off and spread the facts over one scratch
+    # file per month. Keys and attribute combinations are recognized across row groups by their
+    # hashes and new keys are appended to the dictionary files as they appear. The months are
+    # then sorted by date one at a time into the facts file, so memory stays bounded by the row
+    # group size and the largest month of facts plus 16 bytes per distinct key and the dimension
+    # tables.
+    staged = pq.ParquetFile(source)
+    dimension_columns = [col for _, columns in STAR_DIMENSIONS.values() for col in columns]
+    fact_columns = [col for col in staged.schema_arrow.names if col not in dimension_columns]
+    categories = fact_categories(staged, fact_columns)
+    keys = {col: HashLookup() for col in KEY_COLUMNS}
+    combinations = {key: HashLookup() for key in STAR_DIMENSIONS}
+    dimensions = {key: [] for key in STAR_DIMENSIONS}
+    files = {col: StagedParquet(key_dictionary_path(target, col)) for col in KEY_COLUMNS}
+    files['facts'] = StagedParquet(target)
+    scratch = Path(tempfile.mkdtemp(dir=target.parent, suffix='.tmp'))
+    months = {}
+    try:
+        for i in range(staged.num_row_groups):
+            table = staged.read_row_group(i)
+            for col in KEY_COLUMNS:
+                values = table.column(col)
+                codes, first = keys[col].encode(value_hashes(values.to_pandas()))
+                files[col].write(pa.table({'key': values.take(first)}))
+                table = table.set_column(table.schema.get_field_index(col), col, pa.array(codes.astype(np.int32)))
+            for key, (_, columns) in STAR_DIMENSIONS.items():
+                attributes = table.select(columns)
+                codes, first = combinations[key].encode(value_hashes(attributes.to_pandas()))
+                dimensions[key].append(attributes.take(first))
+                table = table.append_column(key, pa.array(codes.astype(np.int32)))
+            for col, col_categories in categories.items():
+                index = table.schema.get_field_index(col)
+                table = table.set_column(index, col, recode_dictionary(table.column(col), col_categories))
+            facts = table.select(fact_columns + list(STAR_DIMENSIONS))
+            for month, part in split_months(facts):
+                if month not in months:
+                    months[month] = StagedParquet(scratch / f'{month}.parquet')
+                months[month].write(part)
+        if not months:
+            # Every row was dropped while cleaning, the facts file still gets its columns
+            files['facts'].write(facts.schema.empty_table())
+        # Months partition the dates, so sorting each (stably, keeping file order among equal
+        # dates) and writing them in order sorts the facts like clean_orders does
+        for month in sorted(months):
+            months[month].commit()
+            facts = pq.read_table(months[month].target)
+            files['facts'].write(facts.take(pc.sort_indices(facts, [('order_date', 'ascending')])))
+            months[month].target.unlink()
+        for key, (name, _) in STAR_DIMENSIONS.items():
+            table = pa.concat_tables(dimensions[key]).replace_schema_metadata(None).to_pandas()
+            # Merging the row groups' dictionaries lists categories in order of appearance, sort
+            # them like standardize_categories does for a file cleaned in memory
+            for col in table.select_dtypes('category'):
+                if not table[col].cat.ordered:
+                    table[col] = table[col].cat.reorder_categories(sorted(table[col].cat.categories))
+            write_parquet(table, dimension_path(target, name))
+        for col in KEY_COLUMNS:
+            files[col].commit()
+        # The facts go last, their file is what marks the snapshot as complete
+        files['facts'].commit()
+    finally:
+        for file in [*files.values(), *months.values()]:
+            file.discard()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+class ChunkDeduplicator:
+    # drop_duplicates across chunks: remember a 64-bit hash per kept row (8 bytes/row)
+    # instead of the rows themselves. rows are already kept, e.g. previously ingested orders.
+    def __init__(self, rows=None):
+        self.seen = np.empty(0, dtype=np.uint64)
+        if rows is not None:
+            self.seen = np.sort(pd.util.hash_pandas_object(rows, index=False).to_numpy())
+
+    def __call__(self, chunk):
+        hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+        keep = ~pd.Series(hashes).duplicated().to_numpy()
+        if len(self.seen):
+            pos = np.searchsorted(self.seen, hashes).clip(max=len(self.seen) - 1)
+            keep &= self.seen[pos] != hashes
+        self.seen = np.sort(np.concatenate([self.seen, hashes[keep]]), kind='stable')
+        return chunk[keep]
+
+
+def widen_dictionaries(schema):
+    import pyarrow as pa
+
+    # Each chunk's categoricals get the narrowest index type for their own categories,
+    # use int32 indices throughout so every chunk fits the file schema
+    for i, field in enumerate(schema):
+        if pa.types.is_dictionary(field.type):
+            wide = pa.dictionary(pa.int32(), field.type.value_type, field.type.ordered)
+            schema = schema.set(i, field.with_type(wide))
+    return schema
+
+
+def ingest_csv_chunked(path, target, chunk_rows=CHUNK_ROWS, typed=True, length=None):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    target = Path(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=target.parent, suffix='.tmp')
+    os.close(fd)
+    dedupe = ChunkDeduplicator()
+    writer = None
+    try:
+        for chunk in read_orders_csv(path, typed=typed, length=length, chunksize=chunk_rows):
+            chunk = add_features(dedupe(normalize_values(chunk)))
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp, widen_dictionaries(table.schema))
+            # Chunks can differ in inferred dtypes and dictionary index widths,
+            # the first chunk's schema wins
+            writer.write_table(table.cast(writer.schema))
+        if writer is None:
+            store_snapshot(clean_orders(read_orders_csv(path, typed=typed, length=length)), target, path)
+            return
+        writer.close()
+        writer = None
+        finish_staged_snapshot(tmp, target)
+        prune_snapshots(target, path)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def load_orders(path=DATA_FILE, columns=None, date_range=None, length=None):
+    # columns limits what is held in memory (see SECTION_COLUMNS); the first load of a new
+    # file still cleans every column, since missing values and duplicates are judged per row.
+    # date_range (start, end) reads only the monthly partitions overlapping it. length loads
+    # only the first length bytes of the file, e.g. up to a line still being written.
+    snapshot = current_snapshot(path, length)
+    if date_range is not None:
+        if not snapshot.exists():
+            load_orders(path, columns=[])
+        months = stored_months(snapshot, *date_range)
+        tables = read_tables(snapshot, columns, months)
+        tables.attrs['months'] = months
+    else:
+        tables = read_snapshot_or_clean(path, snapshot, columns, length)
+    # Derived data (e.g. cubes) is persisted next to the snapshot these tables came from
+    tables.attrs['snapshot'] = str(snapshot)
+    return tables
+
+
+def read_snapshot_or_clean(path, snapshot, columns=None, length=None):
+    if snapshot.exists():
+        try:
+            return read_tables(snapshot, columns)
+        except Exception:
+            # Unreadable snapshot (e.g. written by an incompatible pyarrow), rebuild it below
+            pass
+
+    if (os.path.getsize(path) if length is None else length) > STREAM_THRESHOLD_BYTES:
+        try:
+            ingest_csv_chunked(path, snapshot, length=length)
+        except ValueError:
+            ingest_csv_chunked(path, snapshot, typed=False, length=length)
+        return read_tables(snapshot, columns)
+
+    try:
+        df = clean_orders(read_orders_csv(path, length=length))
+    except ValueError:
+        df = clean_orders(read_orders_csv(path, typed=False, length=length))
+    tables = store_snapshot(df, snapshot, path)
+    # Without a snapshot to read them back from, the other columns have to stay in memory
+    if columns is not None and snapshot.exists():
+        tables = tables.project(columns)
+    return tables
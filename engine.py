@@ -0,0 +1,313 @@
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from aggregations import SECTION_FIELDS, SECTIONS, DashboardAggregates, FilteredTotals, compute_aggregates
+from cube import load_cubes
+from data_loader import (DATA_FILE, SECTION_COLUMNS, OrderTables, current_snapshot, freeze_frame, load_orders,
+                         order_date_bounds, section_columns)
+from exports import ExportCache, write_csv
+from filters import FILTER_DIMENSIONS, FilterIndex, IncrementalMask, date_range_slice
+from incremental import IncrementalOrders
+from profiling import StageTimer
+from result_cache import ResultCache, date_range_key
+from versions import BackgroundRefresher, FullOrders
+
+# Answer chart queries from pre-aggregated cubes instead of the filtered order rows
+USE_CUBE = os.environ.get('DASHBOARD_USE_CUBE', '1') != '0'
+
+# Read only the monthly partitions overlapping the selected date range instead of the whole history
+PARTITIONED = os.environ.get('DASHBOARD_PARTITIONED', '0') == '1'
+
+# refresh() only parses the rows appended to the CSV since the last refresh (not with PARTITIONED)
+INCREMENTAL = os.environ.get('DASHBOARD_INCREMENTAL', '0') == '1' and not PARTITIONED
+
+# The dataset is rebuilt on a background thread and swapped in when ready; this also refreshes it
+# every N seconds (0 = only on refresh())
+REFRESH_SECONDS = int(os.environ.get('DASHBOARD_REFRESH_SECONDS', 0))
+
+# Memory cap of the aggregate results cache (0 disables it)
+RESULT_CACHE_MB = int(os.environ.get('DASHBOARD_RESULT_CACHE_MB', 64))
+
+# Disk space of cached CSV exports
+EXPORT_CACHE_MB = int(os.environ.get('DASHBOARD_EXPORT_CACHE_MB', 256))
+
+# Month ranges of the partitioned store kept in memory
+MONTH_RANGES = 4
+
+# Sections rendered by the dashboard; only their columns are loaded, the download reads the rest on demand
+RENDERED_SECTIONS = ['filters', 'metrics', 'sales_over_time', 'sales_by_category', 'top_products',
+                     'sales_by_day', 'demographics', 'payment_methods', 'sales_by_country']
+DASHBOARD_COLUMNS = section_columns(RENDERED_SECTIONS)
+
+
+@dataclass(frozen=True)
+class EngineConfig:
+    path: str = DATA_FILE
+    use_cube: bool = USE_CUBE
+    partitioned: bool = PARTITIONED
+    incremental: bool = INCREMENTAL
+    refresh_seconds: int = REFRESH_SECONDS
+
+
+@dataclass(frozen=True)
+class FilterSpec:
+    # Filter state of the dashboard. Dates are inclusive days, None for the day of the first or
+    # last order. A dimension left at None keeps every value, otherwise only the values listed.
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    category: Optional[tuple[str, ...]] = None
+    subcategory: Optional[tuple[str, ...]] = None
+    gender: Optional[tuple[str, ...]] = None
+    age_group: Optional[tuple[str, ...]] = None
+    payment_method: Optional[tuple[str, ...]] = None
+
+    def selections(self, filter_index):
+        return {col: filter_index.values(col) if getattr(self, col) is None else list(getattr(self, col))
+                for col in FILTER_DIMENSIONS}
+
+
+@dataclass(frozen=True)
+class DataView:
+    # The data one run reads, taken once so the whole run sees one consistent dataset.
+    # number is the dataset version (0 for the partitioned store); min_date and max_date bound
+    # the whole history, also when only some months of the partitioned store are loaded.
+    number: int
+    orders: OrderTables
+    filter_index: FilterIndex
+    cubes: dict
+    min_date: pd.Timestamp
+    max_date: pd.Timestamp
+
+    @property
+    def version(self):
+        return self.orders.attrs.get('snapshot'), self.number
+
+    def date_range(self, spec):
+        return (self.min_date.date() if spec.start_date is None else spec.start_date,
+                self.max_date.date() if spec.end_date is None else spec.end_date)
+
+
+@dataclass(frozen=True)
+class DashboardResult:
+    # Aggregates of one filter state (None when no order matches) and the key they are cached by
+    key: tuple
+    aggregates: DashboardAggregates
+    approximate: bool
+
+
+class FilterSession:
+    # Per-user filter state: the mask term of every filter and running totals of the filtered
+    # orders. A filter change recomputes only the terms that changed, and the totals are updated
+    # with the orders that entered or left the filtered set unless recounting them all is cheaper.
+    # Totals are kept for the sections asked for so far; opening another section recounts them.
+    def __init__(self):
+        self.filter_index = None
+
+    def update(self, view, selections, date_rows, sections, distinct_only, timer):
+        # Positions of the filtered orders
+        if self.filter_index is not view.filter_index:
+            self.filter_index = view.filter_index
+            self.mask = IncrementalMask(view.filter_index)
+            self.totals = FilteredTotals(view.orders, sections, distinct_only)
+        with timer.span('filter_mask', date_rows.stop - date_rows.start):
+            filtered_rows, added, removed = self.mask.update(selections, date_rows)
+        with timer.span('filtered_totals') as span:
+            if self.totals.covers(sections) and len(added) + len(removed) < len(filtered_rows):
+                self.totals.update(added)
+                self.totals.update(removed, sign=-1)
+                span.rows = len(added) + len(removed)
+            else:
+                sections = [section for section in SECTIONS
+                            if section in sections or section in self.totals.sections]
+                self.totals = FilteredTotals(view.orders, sections, distinct_only)
+                self.totals.update(filtered_rows)
+                span.rows = len(filtered_rows)
+        return filtered_rows
+
+
+class DashboardEngine:
+    # Loading, filtering and aggregation behind the dashboard, without Streamlit. One engine
+    # serves any number of users: each run takes a view() and answers its queries from it, and
+    # every user keeps a FilterSession of their own. Results and exports are cached by filter state.
+    def __init__(self, config=None, result_cache=None, export_cache=None):
+        self.config = config if config is not None else EngineConfig()
+        self.result_cache = result_cache if result_cache is not None else ResultCache(RESULT_CACHE_MB * 1024 * 1024)
+        self.export_cache = export_cache if export_cache is not None else ExportCache(EXPORT_CACHE_MB * 1024 * 1024)
+        self.lock = threading.Lock()
+        self.refresher = None
+        if self.config.partitioned:
+            self.clear()
+        else:
+            if self.config.incremental:
+                dataset = IncrementalOrders(self.config.path, with_cubes=self.config.use_cube)
+            else:
+                dataset = FullOrders(self.config.path, columns=DASHBOARD_COLUMNS, with_cubes=self.config.use_cube)
+            self.refresher = BackgroundRefresher(dataset, self.config.refresh_seconds)
+
+    def clear(self):
+        # Forget everything read from the partitioned store
+        with self.lock:
+            self.bounds = None
+            self.month_ranges = OrderedDict()
+            self.cubes = None
+
+    def refresh(self):
+        # Reload the CSV. The versioned dataset is rebuilt in the background, runs keep reading
+        # the current version until the next one is published.
+        if self.refresher is not None:
+            self.refresher.start()
+        else:
+            self.clear()
+
+    def date_bounds(self):
+        # First and last order date of the partitioned store
+        with self.lock:
+            if self.bounds is None:
+                self.bounds = order_date_bounds(self.config.path)
+            return self.bounds
+
+    def month_range(self, first_month, last_month):
+        # Orders of one range of months with their bitmap indexes; a few recent ranges stay loaded
+        key = first_month, last_month
+        with self.lock:
+            if key in self.month_ranges:
+                self.month_ranges.move_to_end(key)
+                return self.month_ranges[key]
+        orders = load_orders(self.config.path, columns=DASHBOARD_COLUMNS,
+                             date_range=(first_month, last_month)).map(freeze_frame)
+        entry = orders, FilterIndex(orders)
+        with self.lock:
+            self.month_ranges[key] = entry
+            while len(self.month_ranges) > MONTH_RANGES:
+                self.month_ranges.popitem(last=False)
+        return entry
+
+    def partition_cubes(self):
+        # Day x dimension cubes of the whole store; the history is only read to rebuild them
+        with self.lock:
+            if self.cubes is None:
+                self.cubes = load_cubes(current_snapshot(self.config.path),
+                                        lambda: load_orders(self.config.path, columns=DASHBOARD_COLUMNS))
+            return self.cubes
+
+    def view(self, start_date=None, end_date=None):
+        # The current version of the dataset. The partitioned store instead reads only the months
+        # overlapping start_date..end_date (by default the whole history), so the filter values
+        # offered are the ones occurring in those months.
+        if self.refresher is not None:
+            dataset = self.refresher.current
+            dates = dataset.orders['order_date']
+            return DataView(dataset.number, dataset.orders, dataset.filter_index, dataset.cubes,
+                            dates.iloc[0], dates.iloc[-1])
+        min_date, max_date = self.date_bounds()
+        start = min_date if start_date is None else pd.Timestamp(start_date)
+        end = max_date if end_date is None else pd.Timestamp(end_date)
+        orders, filter_index = self.month_range(start.strftime('%Y-%m'), end.strftime('%Y-%m'))
+        cubes = self.partition_cubes() if self.config.use_cube else None
+        return DataView(0, orders, filter_index, cubes, min_date, max_date)
+
+    def query(self, view, spec):
+        # Selections of every filter dimension, the date range and the rows of that range
+        # (orders are sorted by date, so it is found by binary search)
+        selections = spec.selections(view.filter_index)
+        start_date, end_date = view.date_range(spec)
+        return selections, start_date, end_date, date_range_slice(view.orders['order_date'], start_date, end_date)
+
+    def result_key(self, view, spec, approximate=False):
+        selections, start_date, end_date, _ = self.query(view, spec)
+        canonical = view.filter_index.canonical(selections)
+        # The sketches are kept per day, so with other filters set the distinct counts are exact
+        return (view.version, approximate and not canonical,
+                date_range_key(start_date, end_date, view.min_date, view.max_date), canonical)
+
+    def filter_rows(self, view, spec):
+        # Positions of the orders matching spec; the date range is resolved to a row slice and the
+        # other predicates are combined from the bitmap indexes over that slice only
+        selections, _, _, date_rows = self.query(view, spec)
+        return date_rows.start + np.flatnonzero(view.filter_index.mask(selections, date_rows))
+
+    def aggregate(self, view, spec, session=None, approximate=False, timer=None, sections=SECTIONS):
+        # Aggregates of the given dashboard sections (the fields of other sections are None).
+        # Each section's result is cached by a canonical form of the filter state and shared by all
+        # users, so a section computed moments earlier (by anyone) for the same filters is not
+        # filtered and aggregated again. approximate estimates distinct orders and customers from
+        # the cube sketches when only the date range narrows the orders.
+        timer = timer if timer is not None else StageTimer()
+        key = self.result_key(view, spec, approximate and self.config.use_cube)
+        approximate = key[1]
+        fields = {}
+        missing = []
+        for section in sections:
+            cached = self.result_cache.get(key + (section,))
+            if cached is None:
+                missing.append(section)
+            else:
+                fields |= {field: getattr(cached, field) for field in SECTION_FIELDS[section]}
+        if missing:
+            aggregates = self.compute(view, spec, session if session is not None else FilterSession(),
+                                      approximate, timer, missing)
+            if aggregates is None:
+                return DashboardResult(key, None, approximate)
+            for section in missing:
+                cached = self.result_cache.put(key + (section,), DashboardAggregates(
+                    **{field: getattr(aggregates, field) for field in SECTION_FIELDS[section]}))
+                fields |= {field: getattr(cached, field) for field in SECTION_FIELDS[section]}
+        return DashboardResult(key, DashboardAggregates(**fields), approximate)
+
+    def compute(self, view, spec, session, approximate, timer, sections):
+        # None when no order matches the filters
+        selections, start_date, end_date, date_rows = self.query(view, spec)
+        use_cube = self.config.use_cube
+        # Charts are answered from the cube cells matching the filters, or from running totals of
+        # the filtered orders. With cubes the totals only supply exact distinct counts.
+        if not use_cube:
+            totals_sections = sections
+        elif 'metrics' in sections and not approximate:
+            totals_sections = []
+        else:
+            totals_sections = None
+        if totals_sections is not None:
+            filtered_rows = session.update(view, selections, date_rows, totals_sections, use_cube, timer)
+            if not len(filtered_rows):
+                return None
+
+        if use_cube:
+            cubes = view.cubes
+            with timer.span('cube_aggregates') as span:
+                order_cells = cubes['orders'].query(selections, start_date, end_date)
+                span.rows = len(order_cells)
+                if not len(order_cells):
+                    return None
+                distinct_counts = None
+                if approximate:
+                    distinct_counts = (cubes['orders'].distinct_count('order_id', start_date, end_date),
+                                       cubes['orders'].distinct_count('customer_id', start_date, end_date))
+                elif 'metrics' in sections:
+                    distinct_counts = session.totals.distinct_counts()
+                products = None
+                if 'top_products' in sections:
+                    products = cubes['products'].query(selections, start_date, end_date)
+                return compute_aggregates(order_cells, products=products, distinct_counts=distinct_counts,
+                                          sections=sections)
+        with timer.span('row_aggregates'):
+            return session.totals.aggregates()
+
+    def export_csv(self, view, spec, timer=None):
+        # Path of a CSV of every column of the orders matching spec. It is written in chunks (reading
+        # the columns the charts don't need for just those orders from the snapshot) and reused while
+        # the filter state is unchanged.
+        timer = timer if timer is not None else StageTimer()
+
+        def write_export(target):
+            columns = SECTION_COLUMNS['download']
+            rows = self.filter_rows(view, spec)
+            with timer.span('to_csv', len(rows)):
+                write_csv(view.orders.with_columns(columns, rows), None, columns, target)
+        return self.export_cache.path((view.version,) + self.result_key(view, spec)[2:], write_export)
@@ -0,0 +1,76 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from data_loader import decode_keys
+
+# Rows decoded and formatted per step while writing an export
+EXPORT_CHUNK_ROWS = int(os.environ.get('DASHBOARD_EXPORT_CHUNK_ROWS', 100_000))
+
+
+def write_csv(tables, rows, columns, target, chunk_rows=EXPORT_CHUNK_ROWS):
+    # Same text as decode_keys(tables.frame(rows, columns), None, tables.appended_keys)
+    # .to_csv(index=False), written chunk by chunk so only chunk_rows denormalized rows are in
+    # memory at a time. rows None writes every order. The key dictionaries are read once per
+    # export and released with it.
+    rows = np.arange(len(tables)) if rows is None else rows
+    dictionaries = {}
+    with open(target, 'w', newline='') as f:
+        for start in range(0, max(len(rows), 1), chunk_rows):
+            chunk = decode_keys(tables.frame(rows[start:start + chunk_rows], columns), dictionaries,
+                                tables.appended_keys)
+            chunk.to_csv(f, index=False, header=start == 0)
+
+
+class ExportCache:
+    # CSV exports by filter state in a temporary directory, shared by all sessions. The least
+    # recently used files are deleted once together they exceed max_bytes. An export larger than
+    # max_bytes on its own is not kept: its file is deleted when the next export is requested.
+    # The directory is removed with the cache (or at exit).
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.temporary = tempfile.TemporaryDirectory(prefix='dashboard-exports-')
+        self.directory = Path(self.temporary.name)
+        self.entries = OrderedDict()
+        self.size = 0
+        self.oversized = []
+        self.lock = threading.Lock()
+
+    def path(self, key, write):
+        # Path of the export for key, calling write(target) to create it when it isn't cached
+        name = hashlib.sha256(repr(key).encode()).hexdigest()[:32] + '.csv'
+        with self.lock:
+            for oversized in self.oversized:
+                if oversized not in self.entries:
+                    (self.directory / oversized).unlink(missing_ok=True)
+            self.oversized = []
+            if name in self.entries:
+                self.entries.move_to_end(name)
+                return self.directory / name
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(fd)
+        try:
+            write(tmp)
+            os.replace(tmp, self.directory / name)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        size = os.path.getsize(self.directory / name)
+        with self.lock:
+            if name in self.entries:
+                self.size -= self.entries.pop(name)
+            if size > self.max_bytes:
+                self.oversized.append(name)
+                return self.directory / name
+            self.entries[name] = size
+            self.size += size
+            while self.size > self.max_bytes:
+                evicted, evicted_size = self.entries.popitem(last=False)
+                (self.directory / evicted).unlink(missing_ok=True)
+                self.size -= evicted_size
+        return self.directory / name
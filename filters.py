@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+
+# Sidebar multiselect dimensions, each gets a bitmap index at load time
+FILTER_DIMENSIONS = ['category', 'subcategory', 'gender', 'age_group', 'payment_method']
+
+
+def date_range_slice(dates, start_date, end_date):
+    # dates must be sorted ascending; returns the rows with start <= date <= end
+    # in O(log N) instead of comparing the whole column
+    start = dates.searchsorted(pd.to_datetime(start_date), side='left')
+    end = dates.searchsorted(pd.to_datetime(end_date), side='right')
+    return slice(start, end)
+
+
+class BitmapIndex:
+    # One packed bitset (1 bit per row) for every value of a dimension column
+    def __init__(self, series):
+        if not isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype('category')
+        codes = series.cat.codes.to_numpy()
+        counts = np.bincount(codes[codes >= 0], minlength=len(series.cat.categories))
+        self.values = [value for value, count in zip(series.cat.categories, counts) if count]
+        self.bitmaps = {value: np.packbits(codes == code)
+                        for code, value in enumerate(series.cat.categories) if counts[code]}
+        missing = codes < 0
+        self.missing = np.packbits(missing) if missing.any() else None
+        self.n_bytes = (len(codes) + 7) // 8
+
+    def covers(self, selected):
+        selected = set(selected)
+        return all(value in selected for value in self.values) and (
+            self.missing is None or any(pd.isna(value) for value in selected))
+
+    def select(self, selected, byte_range=slice(None)):
+        # OR of the bitmaps of the selected values, restricted to byte_range
+        result = np.zeros(self.n_bytes, dtype=np.uint8)[byte_range]
+        for value in selected:
+            if pd.isna(value):
+                bitmap = self.missing
+            else:
+                bitmap = self.bitmaps.get(value)
+            if bitmap is not None:
+                np.bitwise_or(result, bitmap[byte_range], out=result)
+        return result
+
+
+class FilterIndex:
+    # Bitmap indexes for the filter dimensions, built once per loaded dataset.
+    # A filter state is an OR of bitmaps within each dimension and an AND across dimensions.
+    def __init__(self, df, dimensions=FILTER_DIMENSIONS):
+        self.df = df
+        self.n_rows = len(df)
+        self.indexes = {col: BitmapIndex(df[col]) for col in dimensions}
+        self.hierarchies = {}
+
+    def values(self, col):
+        return self.indexes[col].values
+
+    def child_values(self, parent, selected, child):
+        # Values of child that occur together with the selected parent values
+        # (e.g. the subcategories of the selected categories)
+        if (parent, child) not in self.hierarchies:
+            hierarchy = {}
+            for parent_value, child_value in self.df[[parent, child]].drop_duplicates().itertuples(index=False):
+                hierarchy.setdefault(parent_value, set()).add(child_value)
+            self.hierarchies[parent, child] = hierarchy
+        children = set().union(*(self.hierarchies[parent, child].get(value, ()) for value in selected))
+        return [value for value in self.values(child) if value in children]
+
+    def canonical(self, selections):
+        # Hashable form of selections that is equal for selections with the same mask: values in
+        # index order, values not in the data dropped, dimensions with every value selected left out
+        state = []
+        for col, selected in selections.items():
+            index = self.indexes[col]
+            if index.covers(selected):
+                continue
+            chosen = set(selected)
+            values = tuple(value for value in index.values if value in chosen)
+            missing = index.missing is not None and any(pd.isna(value) for value in selected)
+            state.append((col, values, missing))
+        return tuple(sorted(state))
+
+    def byte_range(self, rows):
+        start, stop, _ = rows.indices(self.n_rows)
+        stop = max(stop, start)
+        return start, stop, slice(start // 8, (stop + 7) // 8)
+
+    def term(self, col, selected, byte_range):
+        # Packed bits of one dimension's predicate, None when the selection covers every value
+        # (the multiselect default) so the dimension is skipped entirely
+        index = self.indexes[col]
+        return None if index.covers(selected) else index.select(selected, byte_range)
+
+    def combine(self, terms, rows):
+        # Boolean mask over df.iloc[rows] from the AND of the packed terms
+        start, stop, byte_range = self.byte_range(rows)
+        terms = [bits for bits in terms if bits is not None]
+        if not terms:
+            return np.ones(stop - start, dtype=bool)
+        result = terms[0].copy()
+        for bits in terms[1:]:
+            np.bitwise_and(result, bits, out=result)
+        offset = start - byte_range.start * 8
+        return np.unpackbits(result).view(bool)[offset:offset + stop - start]
+
+    def mask(self, selections, rows=slice(None)):
+        _, _, byte_range = self.byte_range(rows)
+        return self.combine([self.term(col, selected, byte_range) for col, selected in selections.items()], rows)
+
+
+class IncrementalMask:
+    # Per-session filter state: the packed term of every dimension over the current date slice.
+    # When one filter changes only its term is recomputed before the terms are ANDed again, and
+    # the orders that entered or left the filtered set are reported so totals can be updated.
+    def __init__(self, filter_index):
+        self.filter_index = filter_index
+        self.rows = slice(0, 0)
+        self.keys = {}
+        self.terms = {}
+        self.mask = np.zeros(0, dtype=bool)
+
+    def update(self, selections, rows):
+        # Returns the positions of the filtered orders, of those added and of those removed
+        start, stop, byte_range = self.filter_index.byte_range(rows)
+        if (start, stop) != (self.rows.start, self.rows.stop):
+            self.keys = {}
+            self.terms = {}
+        for col, selected in selections.items():
+            key = self.filter_index.canonical({col: selected})
+            if col not in self.keys or self.keys[col] != key:
+                self.terms[col] = self.filter_index.term(col, selected, byte_range)
+                self.keys[col] = key
+        mask = self.filter_index.combine([self.terms[col] for col in selections], slice(start, stop))
+
+        # Both masks laid over the union of the old and new date slices
+        low = min(start, self.rows.start)
+        high = max(stop, self.rows.stop)
+        old = np.zeros(high - low, dtype=bool)
+        old[self.rows.start - low:self.rows.stop - low] = self.mask
+        new = np.zeros(high - low, dtype=bool)
+        new[start - low:stop - low] = mask
+        flipped = old != new
+        self.rows = slice(start, stop)
+        self.mask = mask
+        return start + np.flatnonzero(mask), low + np.flatnonzero(flipped & new), low + np.flatnonzero(flipped & old)
@@ -0,0 +1,196 @@
+import argparse
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from faker import Faker
+from faker.providers.address.en_US import Provider as AddressProvider
+from faker.providers.lorem.en_US import Provider as LoremProvider
+from faker.providers.person.en_US import Provider as PersonProvider
+
+from data_loader import ORDER_DTYPES
+
+# Column order of synthetic_ecommerce_orders.csv
+CSV_COLUMNS = ['order_id', 'order_date'] + list(ORDER_DTYPES)[1:]
+
+CATEGORIES = {
+    'Books': ['Fiction', 'Non-Fiction', 'Comics'],
+    'Clothing': ['Women', 'Men', 'Children'],
+    'Electronics': ['Mobile Phones', 'Computers', 'Cameras'],
+    'Home & Kitchen': ['Decor', 'Furniture', 'Appliances'],
+    'Sports': ['Fitness', 'Indoor', 'Outdoor'],
+    'Toys': ['Puzzles', 'Action Figures', 'Educational'],
+}
+GENDERS = ['Male', 'Female', 'Other']
+PAYMENT_METHODS = ['Credit Card', 'Debit Card', 'PayPal', 'Net Banking', 'Cash on Delivery']
+
+
+@dataclass
+class GeneratorConfig:
+    rows: int = 10_000
+    start: str = '2021-01-01'
+    end: str = '2024-09-23'
+    customers: int = 1_000
+    products: int = 500
+    # Size of the pools of names, cities and addresses that rows are sampled from
+    pool_size: int = 10_000
+    # Fraction of rows with one field replaced by '?', and of rows repeating an earlier row
+    marker_rate: float = 0.0
+    duplicate_rate: float = 0.0
+    chunk_rows: int = 1_000_000
+    seed: int = 0
+
+
+def uuid_strings(rng, n):
+    # Random version 4 UUIDs, formatted with array operations instead of a Python call per id
+    raw = rng.integers(0, 256, size=(n, 16), dtype=np.uint8)
+    raw[:, 6] = raw[:, 6] & 0x0F | 0x40
+    raw[:, 8] = raw[:, 8] & 0x3F | 0x80
+    digits = np.frombuffer(b'0123456789abcdef', dtype='S1')
+    hex_digits = np.empty((n, 32), dtype='S1')
+    hex_digits[:, 0::2] = digits[raw >> 4]
+    hex_digits[:, 1::2] = digits[raw & 0x0F]
+    dashed = np.insert(hex_digits, [8, 12, 16, 20], b'-', axis=1)
+    return pa.array(dashed.view('S36').ravel()).cast(pa.string())
+
+
+def join_text(*parts):
+    # Element-wise concatenation of string arrays and literal strings
+    return pc.binary_join_element_wise(*parts, '')
+
+
+def digit_text(values, width=0):
+    return pc.utf8_lpad(pa.array(values).cast(pa.string()), width, '0')
+
+
+class OrderGenerator:
+    # Samples order rows in the schema of synthetic_ecommerce_orders.csv. Customers, products
+    # and addresses are drawn once into pools; each chunk of orders is then a handful of
+    # vectorized draws and takes from those pools.
+    def __init__(self, config):
+        self.config = config
+        self.rng = rng = np.random.default_rng(config.seed)
+        fake = Faker('en_US')
+        fake.seed_instance(config.seed)
+        n = config.pool_size
+
+        def sample(values, size=n):
+            values = values if isinstance(values, pa.Array) else pa.array(list(values), pa.string())
+            return values.take(rng.integers(0, len(values), size))
+
+        cities = pa.array([fake.city() for _ in range(n)])
+        streets = pa.array([fake.street_name() for _ in range(n)])
+        names = join_text(sample(PersonProvider.first_names), ' ', sample(PersonProvider.last_names))
+        secondary = sample(['', '', ' Apt. ', ' Suite '])
+        secondary = join_text(secondary, pc.if_else(pc.equal(secondary, ''), '', digit_text(rng.integers(100, 1000, n))))
+        self.addresses = join_text(digit_text(rng.integers(1, 100_000, n)), ' ', sample(streets), secondary, ', ',
+                                   sample(cities), ', ', sample(AddressProvider.states_abbr), ' ',
+                                   digit_text(rng.integers(0, 100_000, n), 5))
+
+        # One fixed set of attributes per product and per customer, like the shipped file
+        subcategories = [(category, sub) for category, subs in CATEGORIES.items() for sub in subs]
+        product_types = rng.integers(0, len(subcategories), config.products)
+        self.products = pa.table({
+            'product_id': uuid_strings(rng, config.products),
+            'product_name': sample([word.title() for word in LoremProvider.word_list], config.products),
+            'category': pa.array([category for category, _ in subcategories]).take(product_types),
+            'subcategory': pa.array([sub for _, sub in subcategories]).take(product_types),
+            'product_price': np.round(rng.uniform(5, 500, config.products), 2),
+        })
+        self.customers = pa.table({
+            'customer_id': uuid_strings(rng, config.customers),
+            'customer_name': sample(names, config.customers),
+            'city': sample(cities, config.customers),
+            'state': sample(AddressProvider.states, config.customers),
+            'country': sample(AddressProvider.countries, config.customers),
+            'age': rng.integers(18, 71, config.customers),
+            'gender': sample(GENDERS, config.customers),
+        })
+        self.payment_methods = pa.array(PAYMENT_METHODS)
+        self.first_second = pd.Timestamp(config.start).value // 10**9
+        self.last_second = pd.Timestamp(config.end).value // 10**9
+
+    def chunk(self, n):
+        rng = self.rng
+        products = self.products.take(rng.integers(0, len(self.products), n))
+        customers = self.customers.take(rng.integers(0, len(self.customers), n))
+        quantity = rng.integers(1, 6, n)
+        price = products['product_price'].to_numpy()
+        columns = {
+            'order_id': uuid_strings(rng, n),
+            'order_date': pa.array(rng.integers(self.first_second, self.last_second, n), pa.timestamp('s')),
+            'quantity': quantity,
+            'order_price': price,
+            'total_amount': np.round(price * quantity, 2),
+            'payment_method': self.payment_methods.take(rng.integers(0, len(self.payment_methods), n)),
+            'shipping_address': self.addresses.take(rng.integers(0, len(self.addresses), n)),
+        }
+        for table in (products, customers):
+            columns.update(zip(table.column_names, table.columns))
+        return self.dirty(pa.table({col: columns[col] for col in CSV_COLUMNS}))
+
+    def dirty(self, table):
+        config = self.config
+        n = len(table)
+        if config.marker_rate:
+            # Every column is text so a '?' fits in any of them, and every chunk has the same schema
+            marked = self.rng.random(n) < config.marker_rate
+            fields = np.where(marked, self.rng.integers(0, len(CSV_COLUMNS), n), -1)
+            table = pa.table({col: pc.if_else(fields == i, '?', table[col].cast(pa.string()))
+                              for i, col in enumerate(CSV_COLUMNS)})
+        if config.duplicate_rate:
+            # A duplicate repeats a random earlier row of the same chunk
+            positions = np.arange(n)
+            repeated = np.flatnonzero(self.rng.random(n) < config.duplicate_rate)
+            repeated = repeated[repeated > 0]
+            positions[repeated] = (self.rng.random(len(repeated)) * repeated).astype(np.int64)
+            table = table.take(positions)
+        return table
+
+    def chunks(self):
+        for start in range(0, self.config.rows, self.config.chunk_rows):
+            yield self.chunk(min(self.config.chunk_rows, self.config.rows - start))
+
+
+def write_orders(config, target, file_format='csv'):
+    # Writes config.rows orders to target one chunk at a time
+    chunks = OrderGenerator(config).chunks()
+    first = next(chunks)
+    if file_format == 'csv':
+        writer = pa_csv.CSVWriter(target, first.schema)
+    else:
+        writer = pq.ParquetWriter(target, first.schema)
+    with writer:
+        writer.write_table(first)
+        for table in chunks:
+            writer.write_table(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic e-commerce orders for load tests')
+    parser.add_argument('target')
+    parser.add_argument('--rows', type=int, default=GeneratorConfig.rows)
+    parser.add_argument('--start', default=GeneratorConfig.start)
+    parser.add_argument('--end', default=GeneratorConfig.end)
+    parser.add_argument('--customers', type=int, default=GeneratorConfig.customers)
+    parser.add_argument('--products', type=int, default=GeneratorConfig.products)
+    parser.add_argument('--pool-size', type=int, default=GeneratorConfig.pool_size)
+    parser.add_argument('--marker-rate', type=float, default=GeneratorConfig.marker_rate)
+    parser.add_argument('--duplicate-rate', type=float, default=GeneratorConfig.duplicate_rate)
+    parser.add_argument('--chunk-rows', type=int, default=GeneratorConfig.chunk_rows)
+    parser.add_argument('--seed', type=int, default=GeneratorConfig.seed)
+    parser.add_argument('--format', choices=['csv', 'parquet'],
+                        help='output format, by default taken from the target extension')
+    args = parser.parse_args()
+    file_format = args.format or ('parquet' if args.target.endswith('.parquet') else 'csv')
+    config = GeneratorConfig(args.rows, args.start, args.end, args.customers, args.products, args.pool_size,
+                             args.marker_rate, args.duplicate_rate, args.chunk_rows, args.seed)
+    write_orders(config, args.target, file_format)
+
+
+if __name__ == '__main__':
+    main()
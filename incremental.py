@@ -0,0 +1,145 @@
+import io
+import os
+import threading
+
+import pandas as pd
+
+from cube import CUBES, OrderCube, load_cubes
+from data_loader import (DATA_FILE, DATE_COLUMNS, KEY_COLUMNS, ORDER_DTYPES, STAR_DIMENSIONS, ChunkDeduplicator,
+                         HashLookup, OrderTables, clean_orders, load_key_dictionary, load_orders, read_orders_csv, sort_by_date, split_dimension, value_hashes)
+from versions import VersionedDataset
+
+# Bytes just before the ingested offset that must be unchanged for the CSV to count as appended to
+BOUNDARY_BYTES = 4096
+
+# Columns that identify a row when dropping duplicates, as in clean_orders
+ROW_COLUMNS = list(ORDER_DTYPES) + DATE_COLUMNS
+
+
+def merged_categories(old, new):
+    # Categories of both, sorted like standardize_categories; old itself if new adds none
+    if new.categories.isin(old.categories).all():
+        return old
+    return pd.CategoricalDtype(old.categories.union(new.categories))
+
+
+def recategorize(df, dtypes):
+    changed = {col: df[col].cat.set_categories(dtype.categories)
+               for col, dtype in dtypes.items() if col in df and df[col].dtype != dtype}
+    return df.assign(**changed) if changed else df
+
+
+class IncrementalOrders(VersionedDataset):
+    # Orders of a CSV that is only ever appended to. refresh() parses just the bytes written
+    # since the last refresh, cleans them like the initial load and appends them to the fact and
+    # dimension tables and cubes. Every refresh publishes a new DatasetVersion as self.current.
+    def __init__(self, path=DATA_FILE, with_cubes=True):
+        self.path = path
+        self.with_cubes = with_cubes
+        self.lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        # Full load (from the snapshot when there is one), the base of later refreshes
+        with open(self.path, 'rb') as f:
+            self.header = f.readline()
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(size - BOUNDARY_BYTES, 0))
+            last_block = f.read()
+        # A partially written last line is left out, and parsed once it is complete
+        self.offset = max(size - len(last_block) + last_block.rfind(b'\n') + 1, len(self.header))
+        tables = load_orders(self.path, length=self.offset)
+        self.snapshot = tables.attrs['snapshot']
+        self.boundary = self.read_boundary()
+        self.next_label = int(tables.facts.index.max()) + 1 if len(tables) else 0
+        # Surrogate keys of the UUIDs seen so far, looked up by hash rather than kept as strings.
+        # UUIDs new since the snapshot are numbered after its dictionary file and kept in memory,
+        # every version gets the ones its orders use (see OrderTables.appended_keys).
+        self.keys = {}
+        self.appended_keys = {}
+        for col in KEY_COLUMNS:
+            if pd.api.types.is_integer_dtype(tables.dtype(col)):
+                self.keys[col] = HashLookup()
+                self.keys[col].add(value_hashes(pd.Series(load_key_dictionary(self.snapshot, col))))
+                self.appended_keys[col] = []
+        history = tables.frame(columns=ROW_COLUMNS)
+        self.row_dtypes = history.dtypes.to_dict()
+        self.dedupe = ChunkDeduplicator(history)
+        cubes = load_cubes(self.snapshot, lambda: tables) if self.with_cubes else None
+        self.publish(tables, cubes)
+
+    def read_boundary(self):
+        with open(self.path, 'rb') as f:
+            f.seek(max(self.offset - BOUNDARY_BYTES, 0))
+            return f.read(self.offset - f.tell())
+
+    def refresh(self):
+        with self.lock:
+            with open(self.path, 'rb') as f:
+                size = f.seek(0, os.SEEK_END)
+                f.seek(self.offset - len(self.boundary))
+                if size < self.offset or f.read(len(self.boundary)) != self.boundary:
+                    # The file was rewritten rather than appended to
+                    self.reload()
+                    return
+                tail = f.read()
+            # Only complete lines, a line still being written is picked up by the next refresh
+            end = tail.rfind(b'\n') + 1
+            if not end:
+                return
+            self.append(self.parse(tail[:end]))
+            self.offset += end
+            self.boundary = self.read_boundary()
+
+    def parse(self, tail):
+        data = io.BytesIO(self.header + tail)
+        try:
+            df = read_orders_csv(data)
+        except ValueError:
+            data.seek(0)
+            df = read_orders_csv(data, typed=False)
+        # Row labels continue after the ingested rows, like one read of the whole file
+        df.index = df.index + self.next_label
+        self.next_label += len(df)
+        return clean_orders(df)
+
+    def append(self, df):
+        if df.empty:
+            return
+        tables = self.current.orders
+        for col, keys in self.keys.items():
+            codes, first = keys.encode(value_hashes(df[col]))
+            if len(first):
+                self.appended_keys[col].append(df[col].iloc[first].array)
+            df[col] = codes
+
+        # New values widen the category dictionaries, the existing tables are recoded to match
+        dtypes = {col: tables.dtype(col) for col in df}
+        changed = {}
+        for col, dtype in dtypes.items():
+            if isinstance(dtype, pd.CategoricalDtype):
+                dtypes[col] = merged_categories(dtype, df[col].astype('category').dtype)
+                if dtypes[col] != dtype:
+                    changed[col] = dtypes[col]
+        df = df.astype(dtypes)
+        df = df.loc[self.dedupe(df[ROW_COLUMNS].astype(self.row_dtypes | changed)).index]
+        if df.empty:
+            return
+
+        # Rows with unseen attribute combinations add dimension rows, existing keys stay valid
+        facts = df.drop(columns=[col for _, columns in STAR_DIMENSIONS.values() for col in columns])
+        dimensions = []
+        for key, (_, columns) in STAR_DIMENSIONS.items():
+            table = recategorize(tables.dimensions[key], changed)
+            keys, table = split_dimension(pd.concat([table, df[columns]], ignore_index=True), columns)
+            facts[key] = keys[len(tables.dimensions[key]):]
+            dimensions.append(table)
+        facts = sort_by_date(pd.concat([recategorize(tables.facts, changed), facts[tables.facts.columns]]))
+        facts.attrs.update(tables.attrs)
+
+        cubes = self.current.cubes
+        if cubes is not None:
+            cubes = {name: OrderCube(recategorize(cube.cells, changed), cube.dimensions, cube.sketches)
+                     .merge(OrderCube.build(df, *CUBES[name])) for name, cube in cubes.items()}
+        appended_keys = {col: tuple(arrays) for col, arrays in self.appended_keys.items()}
+        self.publish(OrderTables(facts, *dimensions, appended_keys), cubes)
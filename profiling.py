@@ -0,0 +1,115 @@
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class Span:
+    stage: str
+    seconds: float = 0.0
+    rows: Optional[int] = None
+    allocated: Optional[int] = None
+
+
+class StageHistory:
+    # Seconds per stage over the last max_runs reruns of a session
+    def __init__(self, max_runs=50):
+        self.runs = deque(maxlen=max_runs)
+
+    def add(self, seconds):
+        self.runs.append(seconds)
+
+    def percentiles(self, stage, q=(50, 95)):
+        seconds = [run[stage] for run in self.runs if stage in run]
+        return np.percentile(seconds, q) if seconds else [np.nan] * len(q)
+
+
+class AllocationTracing:
+    # tracemalloc slows every allocation of the process down, for all sessions, so it only runs
+    # while at least one profiled span does. Tracing started elsewhere (e.g. a benchmark) is left on.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans = 0
+        self.started = False
+
+    def enter(self):
+        with self.lock:
+            if not self.spans and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started = True
+            self.spans += 1
+
+    def exit(self):
+        with self.lock:
+            self.spans -= 1
+            if not self.spans and self.started:
+                tracemalloc.stop()
+                self.started = False
+
+
+TRACING = AllocationTracing()
+
+
+class StageTimer:
+    # Timing spans of one rerun. Disabled (history is None) a span costs next to nothing.
+    # Allocations are the peak of memory traced by tracemalloc within the span; tracing is
+    # process wide, so spans should not be nested and concurrent sessions blur the numbers.
+    def __init__(self, history=None):
+        self.history = history
+        self.spans = {}
+        self.finished = False
+
+    @property
+    def enabled(self):
+        return self.history is not None
+
+    @contextmanager
+    def span(self, stage, rows=None):
+        span = Span(stage, rows=rows)
+        if not self.enabled:
+            yield span
+            return
+        TRACING.enter()
+        tracemalloc.reset_peak()
+        traced = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.seconds = time.perf_counter() - start
+            span.allocated = max(tracemalloc.get_traced_memory()[1] - traced, 0)
+            TRACING.exit()
+            self.record(span)
+
+    def record(self, span):
+        if self.finished:
+            # Spans after the rerun ended (e.g. a download) only count towards the history
+            self.history.add({span.stage: span.seconds})
+            return
+        total = self.spans.get(span.stage)
+        if total is None:
+            self.spans[span.stage] = span
+        else:
+            # Repeated stages in one rerun are added up
+            total.seconds += span.seconds
+            total.rows = None if total.rows is None or span.rows is None else total.rows + span.rows
+            total.allocated = max(total.allocated, span.allocated)
+
+    def finish(self):
+        self.history.add({stage: span.seconds for stage, span in self.spans.items()})
+        self.finished = True
+
+    def table(self):
+        rows = []
+        for stage, span in self.spans.items():
+            p50, p95 = self.history.percentiles(stage)
+            rows.append({'Stage': stage, 'ms': span.seconds * 1000, 'Rows': span.rows,
+                         'Allocated KB': span.allocated / 1024, 'p50 ms': p50 * 1000, 'p95 ms': p95 * 1000})
+        return pd.DataFrame(rows, columns=['Stage', 'ms', 'Rows', 'Allocated KB', 'p50 ms', 'p95 ms'])
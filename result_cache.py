@@ -0,0 +1,65 @@
+import dataclasses
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from data_loader import freeze_frame
+
+
+def date_range_key(start_date, end_date, min_date, max_date):
+    # The sidebar keeps orders with start <= order_date <= end (both at midnight); a bound that
+    # keeps every order is stored as None, so e.g. any start before the first order is one key
+    start = pd.Timestamp(start_date)
+    end = pd.Timestamp(end_date)
+    return (None if start <= min_date else start.date().isoformat(),
+            None if end >= max_date else end.date().isoformat())
+
+
+def bundle_size(aggregates):
+    # Estimated memory of an aggregate bundle, its frames dominate
+    size = 0
+    for field in dataclasses.fields(aggregates):
+        value = getattr(aggregates, field.name)
+        size += value.memory_usage(deep=True).sum() if isinstance(value, pd.DataFrame) else 64
+    return int(size)
+
+
+def freeze_aggregates(aggregates):
+    # Cached bundles are handed to every session, so their frames are made read-only
+    return dataclasses.replace(aggregates, **{
+        field.name: freeze_frame(getattr(aggregates, field.name)) for field in dataclasses.fields(aggregates)
+        if isinstance(getattr(aggregates, field.name), pd.DataFrame)})
+
+
+class ResultCache:
+    # Aggregate bundles by canonical filter state, shared by all sessions. The least recently
+    # used bundles are evicted once the estimated total size exceeds max_bytes.
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, aggregates):
+        size = bundle_size(aggregates)
+        if size > self.max_bytes:
+            return aggregates
+        aggregates = freeze_aggregates(aggregates)
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            self.entries[key] = (aggregates, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+        return aggregates
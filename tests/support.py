@@ -0,0 +1,69 @@
+import dataclasses
+import shutil
+import tempfile
+import unittest
+from datetime import timedelta
+from pathlib import Path
+
+import pandas as pd
+
+import data_loader
+from aggregations import DashboardAggregates
+from engine import FilterSpec
+from filters import FILTER_DIMENSIONS
+
+SAMPLE_CSV = Path(__file__).resolve().parent.parent / data_loader.DATA_FILE
+
+
+class SnapshotTestCase(unittest.TestCase):
+    # Every test gets an empty snapshot directory of its own and a scratch directory for CSVs
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        snapshot_dir = data_loader.SNAPSHOT_DIR
+        data_loader.SNAPSHOT_DIR = self.directory / 'snapshots'
+        self.addCleanup(setattr, data_loader, 'SNAPSHOT_DIR', snapshot_dir)
+        data_loader.cached_snapshot_path.cache_clear()
+        self.addCleanup(data_loader.cached_snapshot_path.cache_clear)
+
+    def write_csv(self, name, lines, mode='wb'):
+        path = self.directory / name
+        with open(path, mode) as f:
+            f.writelines(lines)
+        return str(path)
+
+
+def sample_lines():
+    with open(SAMPLE_CSV, 'rb') as f:
+        return f.readlines()
+
+
+def random_spec(rng, view):
+    # A filter state like a user could set: some dimensions narrowed, maybe a date range
+    fields = {}
+    for col in FILTER_DIMENSIONS:
+        values = view.filter_index.values(col)
+        if rng.random() < 0.4:
+            fields[col] = tuple(rng.sample(values, rng.randint(0, len(values))))
+    days = (view.max_date.date() - view.min_date.date()).days
+    if rng.random() < 0.5:
+        start = rng.randint(0, days)
+        fields['start_date'] = view.min_date.date() + timedelta(days=start)
+        fields['end_date'] = fields['start_date'] + timedelta(days=rng.randint(0, days - start))
+    return FilterSpec(**fields)
+
+
+def assert_aggregates_equal(test, expected, actual, fields=None):
+    # Same chart data up to float summation order
+    if expected is None or actual is None:
+        test.assertIs(expected, actual)
+        return
+    for field in fields or [field.name for field in dataclasses.fields(DashboardAggregates)]:
+        a, b = getattr(expected, field), getattr(actual, field)
+        if isinstance(a, pd.DataFrame):
+            pd.testing.assert_frame_equal(a.reset_index(drop=True), b.reset_index(drop=True),
+                                          check_dtype=False, obj=field)
+        elif isinstance(a, float):
+            test.assertAlmostEqual(a, b, places=6, msg=field)
+        else:
+            test.assertEqual(a, b, msg=field)
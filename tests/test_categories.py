@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from data_loader import decode_keys, load_orders, standardize_categories
+from tests.support import SnapshotTestCase, sample_lines
+
+
+class StandardizeCategoriesTest(SnapshotTestCase):
+    # Categories cleaned on the dictionary must match cleaning every row, with labels that
+    # collapse to the same value merged into one category
+    def test_merges_categories_that_collapse(self):
+        values = pd.Series(['male ', 'Male', ' FEMALE', np.nan, 'female', 'other', 'Male'], dtype='category')
+        standardized = standardize_categories(values)
+        self.assertEqual(list(standardized.cat.categories), ['Female', 'Male', 'Other'])
+        pd.testing.assert_series_equal(standardized.astype(object),
+                                       values.astype(object).str.strip().str.title())
+
+    def test_loaded_orders_merge_spelling_variants(self):
+        header, *lines = sample_lines()
+        variants = {b'Male': [b' male', b'MALE '], b'Female': [b'female', b'Female ']}
+        respelled = []
+        for i, line in enumerate(lines):
+            fields = line.split(b',', 18)
+            if i % 3 == 0 and fields[16] in variants:
+                fields[16] = variants[fields[16]][i % 2]
+            respelled.append(b','.join(fields))
+        expected = load_orders(self.write_csv('orders.csv', [header] + lines))
+        loaded = load_orders(self.write_csv('respelled.csv', [header] + respelled))
+        self.assertEqual(list(loaded['gender'].cat.categories), list(expected['gender'].cat.categories))
+        pd.testing.assert_frame_equal(decode_keys(loaded.frame()), decode_keys(expected.frame()))
@@ -0,0 +1,84 @@
+import gc
+from datetime import date
+
+import numpy as np
+
+from data_loader import SECTION_COLUMNS, current_snapshot, decode_keys, ingest_csv_chunked, load_orders
+from engine import DashboardEngine, EngineConfig, FilterSpec
+from exports import ExportCache
+from result_cache import ResultCache
+from tests.support import SnapshotTestCase, sample_lines
+
+SPEC = FilterSpec(start_date=date(2023, 2, 10), end_date=date(2024, 1, 20), category=('Books', 'Clothing', 'Sports'),
+                  gender=('Female', 'Other'))
+
+
+class ExportTest(SnapshotTestCase):
+    # An export, written in chunks from the dashboard's projected orders plus the columns read back
+    # for the filtered rows, must be the CSV of the fully loaded orders matching the filters
+    def setUp(self):
+        super().setUp()
+        self.path = self.write_csv('orders.csv', sample_lines()[:8001])
+
+    def export(self, **config):
+        engine = DashboardEngine(EngineConfig(path=self.path, use_cube=False, **config), ResultCache(0),
+                                 ExportCache(1 << 30))
+        return engine, engine.export_csv(engine.view(), SPEC).read_bytes()
+
+    def expected(self):
+        orders = load_orders(self.path)
+        dates = orders['order_date']
+        matches = ((dates >= np.datetime64(SPEC.start_date)) & (dates <= np.datetime64(SPEC.end_date))
+                   & orders['category'].isin(SPEC.category) & orders['gender'].isin(SPEC.gender))
+        frame = orders.frame(np.flatnonzero(matches.to_numpy()), SECTION_COLUMNS['download'])
+        return decode_keys(frame, None, orders.appended_keys).to_csv(index=False).encode()
+
+    def test_export_matches_csv_of_loaded_orders(self):
+        _, exported = self.export()
+        self.assertEqual(exported, self.expected())
+
+    def test_chunk_ingested_snapshot(self):
+        # Facts stored in several row groups, of which the export reads only some
+        ingest_csv_chunked(self.path, current_snapshot(self.path), chunk_rows=1500)
+        _, exported = self.export()
+        self.assertEqual(exported, self.expected())
+
+    def test_partitioned_store(self):
+        _, exported = self.export(partitioned=True)
+        self.assertEqual(exported, self.expected())
+
+    def test_appended_orders(self):
+        engine = DashboardEngine(EngineConfig(path=self.path, use_cube=False, incremental=True), ResultCache(0),
+                                 ExportCache(1 << 30))
+        self.write_csv('orders.csv', sample_lines()[8001:], mode='ab')
+        engine.refresher.refresh()
+        self.assertEqual(engine.export_csv(engine.view(), SPEC).read_bytes(), self.expected())
+
+
+class ExportCacheTest(SnapshotTestCase):
+    def write(self, size):
+        def write(target):
+            with open(target, 'wb') as f:
+                f.write(b'x' * size)
+        return write
+
+    def test_caps_total_bytes(self):
+        cache = ExportCache(250)
+        paths = [cache.path(key, self.write(100)) for key in 'abc']
+        # Least recently used first out
+        self.assertFalse(paths[0].exists())
+        self.assertTrue(paths[1].exists() and paths[2].exists())
+        self.assertLessEqual(sum(path.stat().st_size for path in cache.directory.iterdir()), 250)
+        # An export over the cap on its own is handed out, but gone once the next one is requested
+        large = cache.path('large', self.write(300))
+        self.assertEqual(large.stat().st_size, 300)
+        cache.path('b', self.write(100))
+        self.assertFalse(large.exists())
+        self.assertTrue(paths[1].exists() and paths[2].exists())
+
+    def test_directory_removed_with_the_cache(self):
+        cache = ExportCache(1000)
+        directory = cache.path('a', self.write(10)).parent
+        del cache
+        gc.collect()
+        self.assertFalse(directory.exists())
@@ -0,0 +1,38 @@
+import random
+
+import numpy as np
+
+from aggregations import SECTIONS
+from engine import DashboardEngine, EngineConfig, FilterSession
+from profiling import StageTimer
+from result_cache import ResultCache
+from tests.support import SAMPLE_CSV, SnapshotTestCase, assert_aggregates_equal, random_spec
+
+
+class FilteredTotalsTest(SnapshotTestCase):
+    # Masks and totals updated with the orders that entered or left the filtered set must match
+    # a recount of the filtered orders from scratch
+    def setUp(self):
+        super().setUp()
+        self.engine = DashboardEngine(EngineConfig(path=str(SAMPLE_CSV), use_cube=False), ResultCache(0))
+        self.view = self.engine.view()
+
+    def test_incremental_mask_matches_full_mask(self):
+        rng = random.Random(1)
+        session = FilterSession()
+        for _ in range(200):
+            spec = random_spec(rng, self.view)
+            selections, _, _, date_rows = self.engine.query(self.view, spec)
+            filtered = session.update(self.view, selections, date_rows, SECTIONS, False, StageTimer())
+            np.testing.assert_array_equal(filtered, self.engine.filter_rows(self.view, spec))
+
+    def test_running_totals_match_recount(self):
+        rng = random.Random(2)
+        session = FilterSession()
+        for _ in range(200):
+            spec = random_spec(rng, self.view)
+            # Sections opened one after another recount the totals, the others update them
+            sections = rng.sample(SECTIONS, rng.randint(1, len(SECTIONS)))
+            running = self.engine.aggregate(self.view, spec, session, sections=sections)
+            recounted = self.engine.aggregate(self.view, spec, FilterSession(), sections=sections)
+            assert_aggregates_equal(self, recounted.aggregates, running.aggregates)
@@ -0,0 +1,54 @@
+import pandas as pd
+
+from aggregations import compute_aggregates
+from data_loader import KEY_COLUMNS, decode_keys, key_dictionary_path
+from incremental import IncrementalOrders
+from tests.support import SnapshotTestCase, assert_aggregates_equal, sample_lines
+from versions import FullOrders
+
+
+class IncrementalOrdersTest(SnapshotTestCase):
+    # Orders appended to the CSV over several refreshes must end up as a full reload of the file
+    def test_append_matches_full_reload(self):
+        lines = sample_lines()
+        path = self.write_csv('orders.csv', lines[:6001])
+        orders = IncrementalOrders(path)
+        snapshot = orders.snapshot
+        dictionaries = {col: key_dictionary_path(snapshot, col).read_bytes() for col in KEY_COLUMNS}
+        # One batch, a single row, a half-written line completed later, then rows seen before
+        batches = [lines[6001:8000], lines[8000:8001], [lines[8001][:20]],
+                   [lines[8001][20:]] + lines[8002:], lines[100:150]]
+        for batch in batches:
+            self.write_csv('orders.csv', batch, mode='ab')
+            orders.refresh()
+        appended = orders.current
+        # Every refresh appended to the initial load instead of reloading the file
+        self.assertEqual(orders.snapshot, snapshot)
+        # New keys are kept in memory, the dictionary files other workers read are left as they were
+        for col, dictionary in dictionaries.items():
+            self.assertEqual(key_dictionary_path(snapshot, col).read_bytes(), dictionary)
+
+        self.assert_matches_full_reload(appended, path)
+
+    def test_starts_while_a_line_is_written(self):
+        lines = sample_lines()
+        # Cut inside the quoted address, which the CSV parser cannot read
+        path = self.write_csv('orders.csv', lines[:3001] + [lines[3001][:-10]])
+        orders = IncrementalOrders(path)
+        self.assertEqual(len(orders.current.orders), len(FullOrders(self.write_csv('complete.csv', lines[:3001]))
+                                                         .current.orders))
+        self.write_csv('orders.csv', [lines[3001][-10:]] + lines[3002:4001], mode='ab')
+        orders.refresh()
+        self.assert_matches_full_reload(orders.current, path)
+
+    def assert_matches_full_reload(self, appended, path):
+        reloaded = FullOrders(path).current
+        pd.testing.assert_frame_equal(
+            decode_keys(reloaded.orders.frame()).reset_index(drop=True),
+            decode_keys(appended.orders.frame(), appended_keys=appended.orders.appended_keys).reset_index(drop=True))
+        # Cubes merged with the appended orders answer like cubes built from all of them
+        assert_aggregates_equal(self, cube_aggregates(reloaded.cubes), cube_aggregates(appended.cubes))
+
+
+def cube_aggregates(cubes):
+    return compute_aggregates(cubes['orders'].cells, products=cubes['products'].cells, distinct_counts=(0, 0))
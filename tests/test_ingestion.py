@@ -0,0 +1,39 @@
+import pandas as pd
+
+from data_loader import current_snapshot, decode_keys, ingest_csv_chunked, load_orders
+from tests.support import SnapshotTestCase, sample_lines
+
+
+class ChunkedIngestionTest(SnapshotTestCase):
+    # A CSV cleaned in chunks straight into the snapshot must load like one cleaned in memory
+    def assert_chunked_matches_in_memory(self, lines):
+        in_memory = load_orders(self.write_csv('in_memory.csv', lines))
+
+        path = self.write_csv('chunked.csv', lines)
+        ingest_csv_chunked(path, current_snapshot(path), chunk_rows=1500)
+        # Stored sorted by date, so reads need not sort
+        stored = pd.read_parquet(current_snapshot(path), columns=['order_date'])['order_date']
+        self.assertTrue(stored.is_monotonic_increasing)
+        chunked = load_orders(path)
+
+        pd.testing.assert_frame_equal(decode_keys(chunked.frame()).reset_index(drop=True),
+                                      decode_keys(in_memory.frame()).reset_index(drop=True))
+        for key in ['product_key', 'customer_key']:
+            self.assertEqual(len(chunked.dimensions[key]), len(in_memory.dimensions[key]))
+
+    def test_chunked_matches_in_memory(self):
+        lines = sample_lines()
+        fields = lines[1].split(b',', 5)
+        marked = b','.join(fields[:4] + [b'?'] + fields[5:])
+        # Duplicates of rows from earlier chunks and a row with a missing value
+        self.assert_chunked_matches_in_memory(lines + lines[10:20] + [marked])
+
+    def test_categories_first_seen_in_a_later_chunk(self):
+        # No order of the first chunk is paid cash on delivery or is a book, so those categories
+        # only join the dictionaries after the others, but still have to sort first
+        header, *lines = sample_lines()
+        late = [line.split(b',', 18)[8] == b'Books' or line.split(b',', 18)[17] == b'Cash on Delivery'
+                for line in lines]
+        lines = [line for line, moved in zip(lines, late) if not moved] + [
+            line for line, moved in zip(lines, late) if moved]
+        self.assert_chunked_matches_in_memory([header] + lines)
@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from aggregations import DashboardAggregates
+from engine import DashboardEngine, EngineConfig, FilterSpec
+from result_cache import ResultCache, bundle_size
+from tests.support import SAMPLE_CSV, SnapshotTestCase
+
+
+def bundle(rows):
+    return DashboardAggregates(total_orders=rows, sales_by_category=pd.DataFrame({'total_amount': np.ones(rows)}))
+
+
+class ResultKeyTest(SnapshotTestCase):
+    # Filter states that select the same orders must share one cache key
+    def setUp(self):
+        super().setUp()
+        self.engine = DashboardEngine(EngineConfig(path=str(SAMPLE_CSV), use_cube=False), ResultCache(0))
+        self.view = self.engine.view()
+
+    def key(self, **fields):
+        return self.engine.result_key(self.view, FilterSpec(**fields))
+
+    def test_equivalent_filter_states_share_a_key(self):
+        categories = tuple(self.view.filter_index.values('category'))
+        first, last = self.view.min_date.date(), self.view.max_date.date()
+        everything = self.key()
+        self.assertEqual(self.key(category=categories), everything)
+        self.assertEqual(self.key(category=categories[::-1]), everything)
+        # Bounds outside the orders select the same ones as the bounds of the data
+        self.assertEqual(self.key(start_date=first - timedelta(days=30), end_date=last), everything)
+        self.assertEqual(self.key(end_date=last + timedelta(days=1)), self.key(end_date=last + timedelta(days=30)))
+        self.assertEqual(self.key(category=categories[:2]), self.key(category=categories[1::-1]))
+        self.assertEqual(self.key(category=categories[:2] + ('No such category',)), self.key(category=categories[:2]))
+
+    def test_different_filter_states_get_different_keys(self):
+        categories = tuple(self.view.filter_index.values('category'))
+        first = self.view.min_date.date()
+        keys = {self.key(), self.key(category=categories[:1]), self.key(category=categories[1:2]),
+                self.key(start_date=first + timedelta(days=1)), self.key(end_date=first + timedelta(days=1))}
+        self.assertEqual(len(keys), 5)
+
+
+class ResultCacheTest(SnapshotTestCase):
+    def test_evicts_least_recently_used(self):
+        size = bundle_size(bundle(1000))
+        cache = ResultCache(int(size * 2.5))
+        for key in 'abc':
+            if key == 'c':
+                # Reading a moves it ahead of b
+                self.assertIsNotNone(cache.get('a'))
+            cache.put(key, bundle(1000))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+        self.assertLessEqual(cache.size, cache.max_bytes)
+
+    def test_skips_bundles_larger_than_the_cache(self):
+        cache = ResultCache(bundle_size(bundle(1000)))
+        cache.put('small', bundle(1000))
+        cache.put('large', bundle(5000))
+        self.assertIsNone(cache.get('large'))
+        self.assertIsNotNone(cache.get('small'))
+
+    def test_cached_frames_are_read_only(self):
+        cache = ResultCache(1 << 20)
+        cached = cache.put('a', bundle(10))
+        with self.assertRaises(ValueError):
+            cached.sales_by_category.iloc[0, 0] = 2.0
@@ -0,0 +1,37 @@
+import pandas as pd
+
+from engine import DashboardEngine, EngineConfig, FilterSpec
+from result_cache import ResultCache
+from tests.support import SAMPLE_CSV, SnapshotTestCase
+
+
+class SharedDatasetTest(SnapshotTestCase):
+    # Frames shared by every session must reject in-place writes, whatever the column dtype
+    def setUp(self):
+        super().setUp()
+        self.engine = DashboardEngine(EngineConfig(path=str(SAMPLE_CSV), use_cube=True), ResultCache(1 << 30))
+        self.view = self.engine.view()
+
+    def shared_frames(self):
+        orders = self.view.orders
+        frames = {'facts': orders.facts, 'products': orders.products, 'customers': orders.customers}
+        frames.update({f'{name} cube': cube.cells for name, cube in self.view.cubes.items()})
+        cached = self.engine.aggregate(self.view, FilterSpec()).aggregates
+        frames.update({field: value for field, value in vars(cached).items() if isinstance(value, pd.DataFrame)})
+        return frames
+
+    def test_writes_to_every_column_raise(self):
+        dtypes = set()
+        for name, frame in self.shared_frames().items():
+            for i, col in enumerate(frame.columns):
+                with self.subTest(frame=name, column=col, dtype=str(frame[col].dtype)):
+                    dtypes.add(str(frame[col].dtype))
+                    before = frame[col].copy()
+                    # pandas reports a read-only datetime block as an AssertionError
+                    with self.assertRaises((ValueError, AssertionError)):
+                        frame.iloc[0, i] = frame[col].iloc[-1]
+                    with self.assertRaises((ValueError, AssertionError)):
+                        frame[col].array[0] = frame[col].iloc[-1]
+                    pd.testing.assert_series_equal(frame[col], before)
+        # Numbers, dates, categoricals and strings are all covered
+        self.assertTrue({'str', 'category', 'float64', 'int32', 'datetime64[us]'} <= dtypes, dtypes)
@@ -0,0 +1,82 @@
+import random
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from engine import DashboardEngine, EngineConfig, FilterSpec
+from result_cache import ResultCache
+from sketches import DistinctSketch
+from tests.support import SAMPLE_CSV, SnapshotTestCase
+
+
+def hll_bound(sketch):
+    # Three standard errors of a HyperLogLog estimate
+    return 3 * 1.04 / np.sqrt(1 << sketch.precision)
+
+
+class DistinctSketchTest(SnapshotTestCase):
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(4)
+        self.slots = np.sort(rng.integers(0, 2000, 400_000))
+        self.values = pd.Series(rng.integers(0, 300_000, len(self.slots)))
+
+    def test_estimates_within_bound(self):
+        sketch = DistinctSketch.build(self.values, self.slots)
+        rng = random.Random(5)
+        for _ in range(30):
+            start = rng.randrange(2000)
+            end = rng.randrange(start, 2000)
+            rows = (self.slots >= start) & (self.slots <= end)
+            exact = self.values[rows].nunique()
+            self.assertLessEqual(abs(sketch.estimate(start, end) - exact), hll_bound(sketch) * exact + 1,
+                                 (start, end))
+        self.assertEqual(sketch.estimate(2000, 3000), 0)
+
+    def test_merged_sketch_matches_sketch_of_all_values(self):
+        half = len(self.slots) // 2
+        merged = DistinctSketch.build(self.values[:half], self.slots[:half]).merge(
+            DistinctSketch.build(self.values[half:], self.slots[half:]))
+        whole = DistinctSketch.build(self.values, self.slots)
+        np.testing.assert_array_equal(merged.slots, whole.slots)
+        np.testing.assert_array_equal(merged.registers, whole.registers)
+        restored = DistinctSketch.from_frame(whole.to_frame())
+        np.testing.assert_array_equal(restored.registers, whole.registers)
+
+
+class ApproximateCountsTest(SnapshotTestCase):
+    # Sketched distinct counts of a date range must be within the HyperLogLog bound of the exact
+    # counts; with other filters set the counts are exact
+    def setUp(self):
+        super().setUp()
+        self.engine = DashboardEngine(EngineConfig(path=str(SAMPLE_CSV), use_cube=True), ResultCache(0))
+        self.view = self.engine.view()
+
+    def test_date_ranges_within_bound(self):
+        rng = random.Random(6)
+        bound = hll_bound(self.view.cubes['orders'].sketches['order_id'])
+        days = (self.view.max_date - self.view.min_date).days
+        for _ in range(20):
+            offset = rng.randint(0, days)
+            start = self.view.min_date.date() + timedelta(days=offset)
+            spec = FilterSpec(start_date=start, end_date=start + timedelta(days=rng.randint(0, days - offset)))
+            exact = self.engine.aggregate(self.view, spec).aggregates
+            result = self.engine.aggregate(self.view, spec, approximate=True)
+            self.assertTrue(result.approximate)
+            if exact is None:
+                # No order in the range
+                self.assertIsNone(result.aggregates)
+                continue
+            for field in ['total_orders', 'total_customers']:
+                expected = getattr(exact, field)
+                self.assertLessEqual(abs(getattr(result.aggregates, field) - expected), bound * expected + 1,
+                                     (spec, field))
+
+    def test_other_filters_count_exactly(self):
+        spec = FilterSpec(category=tuple(self.view.filter_index.values('category')[:2]))
+        exact = self.engine.aggregate(self.view, spec).aggregates
+        result = self.engine.aggregate(self.view, spec, approximate=True)
+        self.assertFalse(result.approximate)
+        self.assertEqual((result.aggregates.total_orders, result.aggregates.total_customers),
+                         (exact.total_orders, exact.total_customers))
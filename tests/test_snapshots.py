@@ -0,0 +1,38 @@
+import os
+
+import data_loader
+from data_loader import PIPELINE_VERSION, prune_snapshots
+from tests.support import SnapshotTestCase
+
+
+class PruneSnapshotsTest(SnapshotTestCase):
+    # Replacing a snapshot deletes older generations of the same source, except the newest of
+    # them that versions loaded before the swap may still read
+    def generation(self, stem, digest, written_ns):
+        directory = data_loader.SNAPSHOT_DIR
+        name = f'{stem}-{digest * 16}-v{PIPELINE_VERSION}'
+        files = [directory / f'{name}.parquet', directory / f'{name}.products.parquet',
+                 directory / f'{name}.order_id-keys.parquet', directory / f'{name}.orders-cube-v3.cells.parquet',
+                 directory / f'{name}.months' / '2023-01.parquet']
+        for file in files:
+            file.parent.mkdir(parents=True, exist_ok=True)
+            file.write_bytes(b'')
+            os.utime(file, ns=(written_ns, written_ns))
+        return files
+
+    def test_keeps_current_and_previous_generation(self):
+        path = self.write_csv('orders.csv', [])
+        oldest = self.generation('orders', 'a', 1_000)
+        previous = self.generation('orders', 'b', 3_000)
+        older = self.generation('orders', 'c', 2_000)
+        current = self.generation('orders', 'd', 4_000)
+        # Another source file whose name starts with the same stem
+        other = self.generation('orders-2024', 'e', 500)
+
+        prune_snapshots(current[0], path)
+
+        for file in oldest + older:
+            self.assertFalse(file.exists(), file.name)
+        self.assertFalse(oldest[-1].parent.exists())
+        for file in previous + current + other:
+            self.assertTrue(file.exists(), file.name)
@@ -0,0 +1,98 @@
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from pathlib import Path
+
+from cube import OrderCube, load_cubes
+from data_loader import DATA_FILE, OrderTables, current_snapshot, freeze_frame, load_orders
+from filters import FilterIndex
+
+
+@dataclass(frozen=True)
+class DatasetVersion:
+    # One consistent state of the orders and everything derived from them, replaced as a whole
+    number: int
+    orders: OrderTables
+    filter_index: FilterIndex
+    cubes: dict
+
+
+class VersionedDataset:
+    # Readers take self.current once and keep using that version; a refresh builds the next
+    # version on the side and publishes it with a single reference swap
+    current = None
+
+    def publish(self, tables, cubes):
+        tables = tables.map(freeze_frame)
+        if cubes is not None:
+            cubes = {name: OrderCube(freeze_frame(cube.cells), cube.dimensions, cube.sketches)
+                     for name, cube in cubes.items()}
+        number = self.current.number + 1 if self.current is not None else 1
+        self.current = DatasetVersion(number, tables, FilterIndex(tables), cubes)
+
+
+class FullOrders(VersionedDataset):
+    # Orders reloaded in full (from the snapshot when there is one) whenever the CSV changed
+    def __init__(self, path=DATA_FILE, columns=None, with_cubes=True):
+        self.path = path
+        self.columns = columns
+        self.with_cubes = with_cubes
+        self.snapshot = None
+        self.refresh()
+
+    def refresh(self):
+        if current_snapshot(self.path) == self.snapshot:
+            return
+        tables = load_orders(self.path, self.columns)
+        cubes = load_cubes(tables.attrs['snapshot'], lambda: tables) if self.with_cubes else None
+        self.publish(tables, cubes)
+        # The snapshot actually loaded: a CSV changed while loading is picked up by the next refresh
+        self.snapshot = Path(tables.attrs['snapshot'])
+
+
+class BackgroundRefresher:
+    # Runs dataset.refresh() on a worker thread, so sessions keep reading the current version
+    # until the next one is published
+    def __init__(self, dataset, interval=0):
+        self.dataset = dataset
+        self.lock = threading.Lock()
+        self.worker = None
+        self.error = None
+        if interval:
+            threading.Thread(target=refresh_every, args=(weakref.ref(self), interval), daemon=True).start()
+
+    @property
+    def current(self):
+        return self.dataset.current
+
+    @property
+    def refreshing(self):
+        return self.worker is not None and self.worker.is_alive()
+
+    def start(self):
+        # A refresh requested while one is running is dropped, the running one picks up the changes
+        with self.lock:
+            if not self.refreshing:
+                self.worker = threading.Thread(target=self.refresh, daemon=True)
+                self.worker.start()
+
+    def refresh(self):
+        try:
+            self.dataset.refresh()
+            self.error = None
+        except Exception as e:
+            # Keep serving the current version
+            self.error = e
+
+
+def refresh_every(refresher, interval):
+    # refresher is a weak reference, so the thread doesn't keep the refresher and its dataset alive
+    # (e.g. a session's own engine after the session ended) and stops once it is gone
+    while True:
+        time.sleep(interval)
+        current = refresher()
+        if current is None:
+            return
+        current.start()
+        del current